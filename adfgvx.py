@@ -1,27 +1,40 @@
-from itertools import cycle, repeat, chain, islice
+import math
+import random
+import operator
+import itertools
+import instrument
+from array import array
+from collections import Counter
+from functools import lru_cache
 from string import ascii_uppercase, digits
-from crypto import acode, fill, chunks, chunks_iter, normalize, create_trans, join_result
+from crypto import fill, chunks_iter, normalize, recase, StandardAlphabet, Quadgrams, ENGLISH_FREQUENCIES, OFFSET_UPPER
 from math import sqrt
 
 
 ALPHA25 = ascii_uppercase.replace('J', '')
 ADFGVX = 'ADFGVX'
 ADFGX = 'ADFGX'
-OFFSET_ZERO = ord('0') - 26
+# the symbols of a 6x6 grid: the letters, then the digits
+ALPHABET = StandardAlphabet(digits)
 PAD_CODE = 23
+# even widths also try every arrangement of their column pairs, so keep them small
+DEFAULT_MAX_WIDTH = 12
+# widths up to this are solved by trying every column order, wider ones by hill climbing
+ENUMERATE_LIMIT = 8
+WIDTH_TOLERANCE = 0.97
+CLIMB_RESTARTS = 20
+# annealing schedule for the substitution grid, as in playfair.crack
+TEMPERATURE_PER_LETTER = 0.09
+GRID_STEPS = 20_000
+GRID_RESTARTS = 3
+RESCORE_LIMIT = 8
 
 
-def acode36(c):
-	if '0' <= c <= '9':
-		return ord(c) - OFFSET_ZERO
-	return acode(c)
-
-
-def grid_lookup(grid, coord):
-	lookup = [None] * len(coord) ** 2
+def grid_lookup(grid, coord, alphabet=ALPHABET):
+	lookup = [None] * alphabet.size
 	for i, row in enumerate(grid):
 		for j, c in enumerate(row):
-			lookup[acode36(c)] = coord[i] + coord[j]
+			lookup[alphabet.encode(c)] = coord[i] + coord[j]
 	return lookup
 
 
@@ -29,28 +42,59 @@ def unalphabetize(word):
 	return [t[0] for t in sorted(enumerate(word), key=lambda c: c[1])]
 
 
-def transpose(columns, word):
-	ordered = list(zip(word, columns))
-	ordered.sort(key=lambda g: g[0])
-	for _, col in ordered:
-		yield col
+@lru_cache(maxsize=256)
+def read_order(word):
+	# the columns in the order they are read out; ties keep their order in the word
+	return tuple(unalphabetize(word))
+
+
+def columnar(data, word):
+	# writes data in rows as wide as the word, then reads it out by columns
+	width = len(word)
+	return b''.join(data[c::width] for c in read_order(word))
+
+
+def uncolumnar(data, word):
+	return unscramble(data, read_order(word))
+
+
+def unscramble(data, order):
+	width = len(order)
+	height = len(data) // width
+	result = bytearray(height * width)
+	for i, c in enumerate(order):
+		result[c::width] = data[i * height:(i + 1) * height]
+	return bytes(result)
 
 
 class Adfgvx:
 
-	def __init__(self, grid, word, coord):
+	@instrument.measured('adfgvx.Adfgvx.__init__')
+	def __init__(self, grid, word, coord, alphabet=ALPHABET):
+		if not word:
+			raise ValueError("the transposition word must contain at least one letter")
 		self.grid = grid
-		self.grid_lookup = grid_lookup(grid, coord)
+		self.grid_lookup = grid_lookup(grid, coord, alphabet)
 		self.word = word
 		self.coord = coord
 		self.coord_lookup = {c: i for i, c in enumerate(coord)}
+		self.sub_table = {}
+		for c, pair in zip(alphabet.letters, self.grid_lookup):
+			if pair is not None:
+				self.sub_table[ord(recase(c, str.upper))] = self.sub_table[ord(recase(c, str.lower))] = pair
+		if ord('J') not in self.sub_table and ord('I') in self.sub_table:
+			# J shares a cell with I, as in Playfair
+			self.sub_table[ord('J')] = self.sub_table[ord('j')] = self.sub_table[ord('I')]
+		self.unsub_table = {coord[i] + coord[j]: c.lower() for i, row in enumerate(grid) for j, c in enumerate(row)}
 
 	@classmethod
 	def from_keyword(cls, grid_keyword, word, coord):
 		return cls.create(list(fill(grid_keyword.replace('J', 'I'), ALPHA25)), word, coord)
 
 	@classmethod
-	def create(cls, grid_seq, word, coord=None):
+	def create(cls, grid_seq, word, coord=None, alphabet=ALPHABET):
+		if not word:
+			raise ValueError("the transposition word must contain at least one letter")
 		dim = sqrt(len(grid_seq))
 		if dim != 5 and dim != 6:
 			raise ValueError(f"grid must be perfect square with dimensions 5x5 or 6x6 but had size {len(grid_seq)}")
@@ -66,61 +110,253 @@ class Adfgvx:
 		elif len(set(coord)) != dim:
 			raise ValueError(f"coordinates ({coord}) have duplicate letters")
 
-		return cls(list(chunks_iter(grid_seq, dim)), word, coord)
+		return cls(list(chunks_iter(grid_seq, dim)), word, coord, alphabet)
+
+	def subs(self, message, width):
+		# the coordinates of every letter, padded with those of X to fill the last row
+		result = message.translate(self.sub_table)
+		if len(result) != len(message) * 2:
+			missing = ''.join(sorted({c for c in message if ord(c) not in self.sub_table}))
+			raise ValueError(f"grid does not contain {missing}")
+		padding = -len(result) % width
+		return result + (self.grid_lookup[PAD_CODE] * padding)[:padding]
 
-	def subs(self, message, word):
-		for c in message
-			yield from self.grid_lookup[acode36(c)]
-		for _ in range(-len(message) * 2 % len(word))
-		padded = chain(message, repeat('X'))
-		subs = chain.from_iterable( )
-		# there's got to be a better way
-		subs = islice(subs, len(word) * (len(message) * 2 + (-len(message) * 2 % word)))
+	def unsubs(self, coords):
+		coords = coords[:len(coords) & ~1]  # round down to nearest even number
+		try:
+			return ''.join(map(self.unsub_table.__getitem__, map(operator.add, coords[0::2], coords[1::2])))
+		except KeyError as e:
+			raise ValueError(f"grid has no cell at {e.args[0]}") from None
 	
-	@join_result
+	@instrument.measured('adfgvx.Adfgvx.encrypt', len)
 	def encrypt(self, message, word=None):
 		word = word or self.word
-		padded = chain(message, repeat('X'))
-		subs = chain.from_iterable(self.grid_lookup[acode36(c)] for c in padded)
-		# there's got to be a better way
-		subs = islice(subs, len(word) * (len(message) * 2 + (-len(message) * 2 % word)))
-		columns = zip(*chunks_iter(subs, len(word)))
-		scrambled = transpose(columns, word)
-		return chain.from_iterable(scrambled)
+		return columnar(self.subs(message, len(word)).encode('ascii'), word).decode('ascii')
 	
-	@join_result
+	@instrument.measured('adfgvx.Adfgvx.decrypt', len)
 	def decrypt(self, message, word=None):
 		word = word or self.word
-		columns = chunks(message, len(message) // len(word))
-		unscrambled = transpose(columns, unalphabetize(word))
-		rows = chain.from_iterable(zip(*unscrambled))
-		rows = islice(rows, len(message) & ~1)  # round down to nearest even number
-		indices = (self.coord_lookup[c] for c in rows)
-		for i, j in chunks_iter(indices, 2):
-			yield self.grid[i][j].lower()
+		message = message[:len(message) - len(message) % len(word)]
+		return self.unsubs(uncolumnar(message.encode('ascii'), word).decode('ascii'))
 
 
-if __name__ == '__main__':
+def digraph_coincidence(data):
+	# how often two coordinate pairs match; high when each pair stands for one plaintext letter
+	pairs = array('H', data[:len(data) & ~1])
+	n = len(pairs)
+	if n < 2:
+		return 0
+	return sum(c * (c - 1) for c in Counter(pairs).values()) / (n * (n - 1))
+
+
+def affinity(data, width):
+	# how much like real coordinate pairs cipher column y looks when it follows column x;
+	# with an odd width a column pair only lines up on every other row
+	height = len(data) // width
+	columns = [data[i * height:(i + 1) * height] for i in range(width)]
+	phases = (0,) if width % 2 == 0 else (0, 1)
+	result = [[0] * width for _ in range(width)]
+	for x, y in itertools.permutations(range(width), 2):
+		for phase in phases:
+			step = len(phases)
+			pairs = bytearray(2 * len(columns[x][phase::step]))
+			pairs[0::2] = columns[x][phase::step]
+			pairs[1::2] = columns[y][phase::step]
+			result[x][y] = max(result[x][y], digraph_coincidence(pairs))
+	return result
+
+
+def greedy_orders(data, width):
+	# chains of cipher columns, each next one the best match for the last, from every start
+	links = affinity(data, width)
+	for start in range(width):
+		chain = [start]
+		while len(chain) < width:
+			chain.append(max(set(range(width)) - set(chain), key=lambda y: links[chain[-1]][y]))
+		# chain lists cipher columns in plaintext order; the read order is its inverse
+		order = [0] * width
+		for position, column in enumerate(chain):
+			order[column] = position
+		yield order
+
+
+def solve_width(data, width, seed=0):
+	# the best read order for a transposition of this width, by digraph coincidence
+	def score(order):
+		return digraph_coincidence(unscramble(data, order))
+
+	if width <= ENUMERATE_LIMIT:
+		best = max(itertools.permutations(range(width)), key=score)
+		return score(best), width, best
+
+	rng = random.Random(seed)
+	starts = list(greedy_orders(data, width)) + [rng.sample(range(width), width) for _ in range(CLIMB_RESTARTS)]
+	best, best_score = None, -1
+	for order in starts:
+		current = score(order)
+		improved = True
+		while improved:
+			improved = False
+			for i, j in itertools.combinations(range(width), 2):
+				order[i], order[j] = order[j], order[i]
+				candidate = score(order)
+				if candidate > current:
+					current = candidate
+					improved = True
+				else:
+					order[i], order[j] = order[j], order[i]
+		if current > best_score:
+			best, best_score = tuple(order), current
+	return best_score, width, best
+
+
+def bigram_coincidence(data):
+	# how often two consecutive coordinate pairs match
+	pairs = array('H', data[:len(data) & ~1])
+	n = len(pairs) - 1
+	if n < 2:
+		return 0
+	return sum(c * (c - 1) for c in Counter(zip(pairs, pairs[1:])).values()) / (n * (n - 1))
+
+
+def arrange_pairs(data, order):
+	# with an even width every row holds whole pairs of columns, and moving those pairs
+	# around leaves the digraph counts alone, so they are ordered by bigram counts instead
+	width = len(order)
+	if width % 2:
+		return order
+
+	def rearranged(blocks):
+		new_column = {}
+		for new, old in enumerate(blocks):
+			new_column[2 * old] = 2 * new
+			new_column[2 * old + 1] = 2 * new + 1
+		return tuple(new_column[c] for c in order)
+
+	return max(map(rearranged, itertools.permutations(range(width // 2))),
+		key=lambda candidate: bigram_coincidence(unscramble(data, candidate)))
+
+
+def order_word(order):
+	# a transposition keyword with this read order
+	word = [''] * len(order)
+	for rank, c in enumerate(order):
+		word[c] = chr(OFFSET_UPPER + rank)
+	return ''.join(word)
+
+
+def solve_grid(cells, symbols, fitness, seed=0):
+	# cells is bytes of grid cell numbers; returns the symbol in each cell.
+	# anneals from the frequency ranking, swapping the symbols of two cells at a time
+	counts = Counter(cells)
+	by_count = sorted(range(len(symbols)), key=lambda cell: -counts[cell])
+	by_frequency = sorted(symbols, key=lambda a: -ENGLISH_FREQUENCIES[a] if a < 26 else 0)
+	start = bytearray(len(symbols))
+	for cell, a in zip(by_count, by_frequency):
+		start[cell] = a
+
+	def decode(key):
+		return cells.translate(bytes(key).ljust(256, b'\0'))
+
+	# a swap between rare cells touches few letters, which are cheaper to rescore alone
+	where = [[] for _ in symbols]
+	for p, cell in enumerate(cells):
+		where[cell].append(p)
+
+	rng = random.Random(seed)
+	best, best_score = bytes(start), fitness.score(decode(start))
+	for _ in range(GRID_RESTARTS):
+		key = bytearray(start)
+		plain = decode(key)
+		current = fitness.score(plain)
+		start_temperature = TEMPERATURE_PER_LETTER * len(cells)
+		for step in range(GRID_STEPS, 0, -1):
+			i, j = rng.sample(range(len(key)), 2)
+			key[i], key[j] = key[j], key[i]
+			candidate_plain = decode(key)
+			if len(where[i]) + len(where[j]) <= RESCORE_LIMIT:
+				candidate = current + fitness.rescore(plain, candidate_plain, where[i] + where[j])
+			else:
+				candidate = fitness.score(candidate_plain)
+			delta = candidate - current
+			if delta >= 0 or rng.random() < math.exp(delta / (start_temperature * step / GRID_STEPS)):
+				plain, current = candidate_plain, candidate
+				if current > best_score:
+					best, best_score = bytes(key), current
+			else:
+				key[i], key[j] = key[j], key[i]
+	return best
+
+
+def crack(ciphertext, fitness, coord=None, max_width=DEFAULT_MAX_WIDTH, workers=None):
+	# returns an Adfgvx with the recovered grid and transposition keyword
+	from concurrent.futures import ProcessPoolExecutor
+	ciphertext = ''.join(c for c in ciphertext.upper() if not c.isspace())
+	if coord is None:
+		coord = ADFGVX if set(ciphertext) - set(ADFGX) else ADFGX
+	stray = set(ciphertext) - set(coord)
+	if stray:
+		raise ValueError(f"ciphertext has symbols other than the coordinates {coord}: {''.join(sorted(stray))}")
+	data = ciphertext.encode('ascii')
+	widths = [w for w in range(2, min(max_width, 26) + 1) if len(data) % w == 0]
+	if not widths:
+		raise ValueError(f"no transposition width up to {max_width} divides the message length {len(data)}")
+
+	with ProcessPoolExecutor(workers) as executor:
+		results = list(executor.map(solve_width, itertools.repeat(data), widths))
+	# a multiple of the width can stack rows to reproduce the same pairs, so take the
+	# narrowest width that scores about as well as the best
+	best_score = max(score for score, _, _ in results)
+	_, width, order = next(r for r in results if r[0] >= WIDTH_TOLERANCE * best_score)
+
+	order = arrange_pairs(data, order)
+	stream = unscramble(data, order)
+	dim = len(coord)
+	coord_index = {ord(c): i for i, c in enumerate(coord)}
+	cells = bytes(coord_index[a] * dim + coord_index[b] for a, b in zip(stream[0::2], stream[1::2]))
+	symbols = list(ALPHABET.encode_all(ALPHA25 if dim == 5 else ALPHABET.letters))
+	key = solve_grid(cells, symbols, fitness)
+	grid = ALPHABET.decode_all(key)
+	return Adfgvx.create(grid, order_word(order), coord)
+
+
+def main(argv=None):
 	import argparse
 	import cryptoargs
 
 	parser = argparse.ArgumentParser(prog='adfgvx',
 		description='Applies the ADFGVX Cipher to a message. ' + cryptoargs.MODE_INSTRUCTIONS)
 	cryptoargs.add_input(parser)
-	parser.add_argument('-g', '--grid', type=str, required=True, help='the grid (in one line), or a keyword (5x5 mode only)')
-	parser.add_argument('-w', '--word', type=str, required=True, help='the transposition keyword')
+	parser.add_argument('-g', '--grid', type=str, help='the grid (in one line), or a keyword (5x5 mode only)')
+	parser.add_argument('-w', '--word', type=str, help='the transposition keyword')
 	parser.add_argument('-c', '--coord', type=str, help='the alphabet of coordinates')
+	parser.add_argument('-s', '--solve', type=str, metavar='QUADGRAMS', help='recover an unknown grid and keyword, scoring candidates against a quadgram table (or the English text to build one from), report them and decrypt')
+	parser.add_argument('--max-width', type=int, default=DEFAULT_MAX_WIDTH, help=f'the longest transposition keyword --solve tries (default {DEFAULT_MAX_WIDTH})')
 	# random padding
 	# grid encrypt mode
 	cryptoargs.add_mode(parser)
 	cryptoargs.add_output(parser)
-	args = parser.parse_args()
-	
-	trans = create_trans(digits)
+	args = parser.parse_args(argv)
 
-	message = cryptoargs.get_input(args).translate(trans)
+	if args.solve is not None:
+		import sys
+		message = cryptoargs.get_input(args)
+		try:
+			cipher = crack(message, Quadgrams.open(args.solve), args.coord, args.max_width)
+		except ValueError as e:
+			parser.error(f"argument message: {e}")
+		grid = ''.join(''.join(row) for row in cipher.grid)
+		print(f"grid: {grid} word: {cipher.word}", file=sys.stderr)
+		cryptoargs.write_result(args, cipher.decrypt(''.join(message.upper().split())))
+		sys.exit()
+	if args.grid is None or args.word is None:
+		parser.error('the following arguments are required: -g/--grid, -w/--word')
+	
+	message = normalize(cryptoargs.get_input(args), digits)
 	grid = args.grid
 	word = normalize(args.word).upper()
+	if not word:
+		parser.error('argument -w/--word: must contain at least one letter')
 	coord = args.coord
 	if len(grid) < 25 and coord is None:
 		create = Adfgvx.from_keyword
@@ -134,5 +370,12 @@ if __name__ == '__main__':
 	if mode is None:
 		mode = cipher.encrypt if cryptoargs.probe_text(message) else cipher.decrypt
 
-	# print(len(mode(message)))
-	cryptoargs.write_result(args, mode(message))
+	try:
+		result = mode(message)
+	except ValueError as e:
+		parser.error(f"argument message: {e}")
+	cryptoargs.write_result(args, result)
+
+
+if __name__ == '__main__':
+	main()
@@ -1,11 +1,143 @@
 from collections import deque
+from functools import lru_cache
+from itertools import accumulate, repeat
+from operator import mod
+import instrument
+from crypto import join_result, normalize, use_pool, ALPHABET, OFFSET_LOWER, OFFSET_UPPER
+from vigenere import results, SUM_LIMIT
+
+
+# messages at least this long are decrypted by a pool of workers, one window each
+PARALLEL_SIZE = 1 << 22
+WINDOW_SIZE = 1 << 20
+
 
 @join_result
-def autokey(message, key, sign, offset):
-	key = deque(acode(k) for k in key)
+def autokey(message, key, sign, offset, alphabet=ALPHABET):
+	# each key letter is used once, then the ciphertext takes its place
+	result = results(alphabet, offset)
+	key = deque(alphabet.encode(k) for k in key)
 	for m in message:
-		a = acode(m)
+		a = alphabet.encode(m)
 		k = key.popleft()
-		
-		yield chr((a + sign * k) % 26 + offset)
-		key.append((a + sign * k) % 26)
+
+		yield chr(result[(a + sign * k) % alphabet.size])
+		key.append((a + k) % alphabet.size if sign > 0 else a)
+
+
+def primer(key, alphabet=ALPHABET):
+	# the key as the cipher sees it: only its letters, unless the alphabet has other symbols
+	return normalize(key) if alphabet is ALPHABET else key
+
+
+def feedback(key, alphabet=ALPHABET):
+	# the resumable state of the cipher: the last len(key) ciphertext codes
+	key = primer(key, alphabet)
+	if not key:
+		raise ValueError("the autokey key must contain at least one letter")
+	return deque(alphabet.encode_all(key), maxlen=len(key))
+
+
+@lru_cache(maxsize=64)
+def negate(alphabet):
+	return bytes(-a % alphabet.size for a in range(256))
+
+
+def unshift(data, stream, offset, alphabet=ALPHABET):
+	# subtracts stream from data, both bytes of codes; adding the negated codes as
+	# big integers never carries from one byte into the next
+	result = results(alphabet, offset)
+	if alphabet.size > SUM_LIMIT:
+		return bytes(result[(a - b) % alphabet.size] for a, b in zip(data, stream)).decode('latin-1')
+	total = int.from_bytes(data, 'big') + int.from_bytes(stream.translate(negate(alphabet)), 'big')
+	return total.to_bytes(len(data), 'big').translate(result).decode('latin-1')
+
+
+def decrypt_window(chunk, stream, alphabet=ALPHABET):
+	return unshift(alphabet.encode_all(chunk), alphabet.encode_all(stream[:len(chunk)]), OFFSET_LOWER, alphabet)
+
+
+@instrument.measured('autokey.autokey_chunk', len)
+def autokey_chunk(chunk, state, sign, offset, alphabet=ALPHABET):
+	# continues the cipher from state, updating it to follow this chunk
+	data = alphabet.encode_all(chunk)
+	width = state.maxlen
+	if sign > 0:
+		# every column is a running sum of its plaintext, starting from its key letter
+		cipher = bytearray(len(data))
+		for i, k in zip(range(width), state):
+			cipher[i::width] = bytes(map(mod, accumulate(data[i::width], initial=k), repeat(alphabet.size)))[1:]
+		result = cipher.translate(results(alphabet, offset)).decode('latin-1')
+	else:
+		cipher = data
+		result = unshift(data, (bytes(state) + data)[:len(data)], offset, alphabet)
+	state.extend(cipher[-width:])
+	return result
+
+
+def autokey_stream(chunks, state, sign, offset, alphabet=ALPHABET):
+	for chunk in chunks:
+		yield autokey_chunk(chunk, state, sign, offset, alphabet)
+
+
+def encrypt(message, key, alphabet=ALPHABET):
+	return autokey_chunk(message, feedback(key, alphabet), +1, OFFSET_UPPER, alphabet)
+
+def decrypt(message, key, alphabet=ALPHABET, *, workers=None):
+	state = feedback(key, alphabet)
+	if not use_pool(message, workers, PARALLEL_SIZE):
+		return autokey_chunk(message, state, -1, OFFSET_LOWER, alphabet)
+	from concurrent.futures import ProcessPoolExecutor
+	# each plaintext letter depends only on the ciphertext len(key) letters earlier,
+	# so every window can be decrypted on its own
+	stream = primer(key, alphabet) + message
+	bounds = range(0, len(message), WINDOW_SIZE)
+	with ProcessPoolExecutor(workers) as executor:
+		return ''.join(executor.map(decrypt_window,
+			(message[i:i + WINDOW_SIZE] for i in bounds),
+			(stream[i:i + WINDOW_SIZE] for i in bounds),
+			repeat(alphabet)))
+
+def encrypt_stream(chunks, key, state=None, alphabet=ALPHABET):
+	return autokey_stream(chunks, state if state is not None else feedback(key, alphabet), +1, OFFSET_UPPER, alphabet)
+
+def decrypt_stream(chunks, key, state=None, alphabet=ALPHABET):
+	return autokey_stream(chunks, state if state is not None else feedback(key, alphabet), -1, OFFSET_LOWER, alphabet)
+
+
+def main(argv=None):
+	import argparse
+	import cryptoargs
+
+	parser = argparse.ArgumentParser(prog='autokey',
+		description='Applies the Autokey Cipher (with ciphertext feedback) to a message. ' + cryptoargs.MODE_INSTRUCTIONS)
+	cryptoargs.add_input(parser)
+	parser.add_argument('-k', '--key', type=str, required=True, help='the primer key')
+	parser.add_argument('-j', '--jobs', type=int, help='decrypt with this many worker processes, reading the whole message at once')
+	cryptoargs.add_mode(parser)
+	cryptoargs.add_output(parser)
+	args = parser.parse_args(argv)
+
+	key = normalize(args.key)
+	if not key:
+		parser.error('argument -k/--key: must contain at least one letter')
+	if args.jobs is not None:
+		import sys
+		message = normalize(cryptoargs.get_input(args))
+		mode = cryptoargs.get_mode(args, encrypt, decrypt)
+		if mode is None:
+			mode = encrypt if cryptoargs.probe_text(message) else decrypt
+		cryptoargs.write_result(args, decrypt(message, key, workers=args.jobs) if mode is decrypt else encrypt(message, key))
+		sys.exit()
+
+	chunks = map(normalize, cryptoargs.read_chunks(args))
+	mode = cryptoargs.get_mode(args, encrypt_stream, decrypt_stream)
+	if mode is None:
+		plaintext, chunks = cryptoargs.probe_chunks(chunks)
+		mode = encrypt_stream if plaintext else decrypt_stream
+
+	cryptoargs.write_chunks(args, mode(chunks, key))
+
+
+if __name__ == '__main__':
+	main()
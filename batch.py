@@ -0,0 +1,136 @@
+import itertools
+from functools import lru_cache
+from string import digits
+from crypto import normalize, chunks
+from cryptoargs import probe_text
+import vigenere
+import greenwall
+import autokey
+from playfair import Playfair
+from adfgvx import Adfgvx
+
+
+# records are sent to the workers this many at a time
+BATCH_SIZE = 256
+
+
+# each builder takes the key fields of a record and returns (encrypt, decrypt),
+# preparing the text the same way as the cipher's own command line
+
+def vigenere_cipher(key):
+	key = normalize(key)
+	if not key:
+		raise ValueError("the Vigenère key must contain at least one letter")
+	return lambda text: vigenere.encrypt(normalize(text), key), lambda text: vigenere.decrypt(normalize(text), key)
+
+
+def autokey_cipher(key):
+	key = normalize(key)
+	return lambda text: autokey.encrypt(normalize(text), key), lambda text: autokey.decrypt(normalize(text), key)
+
+
+def greenwall_cipher(horizontal, vertical):
+	horizontal = normalize(horizontal, greenwall.PUNCT)
+	vertical = normalize(vertical, greenwall.PUNCT)
+	return (lambda text: greenwall.encrypt(normalize(text, greenwall.PUNCT), horizontal, vertical),
+		lambda text: greenwall.decrypt(normalize(text, greenwall.PUNCT), horizontal, vertical))
+
+
+def playfair_cipher(key):
+	pf = Playfair.from_keyword(normalize(key))
+	return lambda text: pf.encrypt(normalize(text)), lambda text: pf.decrypt(normalize(text))
+
+
+def adfgvx_cipher(grid, word, coord):
+	if len(grid) < 25 and coord is None:
+		cipher = Adfgvx.from_keyword(grid, normalize(word).upper(), coord)
+	else:
+		cipher = Adfgvx.create(grid.upper(), normalize(word).upper(), coord)
+	return lambda text: cipher.encrypt(normalize(text, digits)), lambda text: cipher.decrypt(normalize(text, digits))
+
+
+CIPHERS = {
+	'vigenere': (vigenere_cipher, ('key',)),
+	'autokey': (autokey_cipher, ('key',)),
+	'greenwall': (greenwall_cipher, ('horizontal', 'vertical')),
+	'playfair': (playfair_cipher, ('key',)),
+	'adfgvx': (adfgvx_cipher, ('grid', 'word', 'coord')),
+}
+OPTIONAL = {'coord'}
+
+
+@lru_cache(maxsize=256)
+def cipher(name, params):
+	# records with the same key share one cipher, and with it any tables it built
+	build, _ = CIPHERS[name]
+	return build(*params)
+
+
+def run(record):
+	# every record gets a result, even one the cipher rejects
+	if isinstance(record, ValueError):
+		return {'error': f"invalid JSON: {record}"}
+	if not isinstance(record, dict):
+		return {'error': f"a record must be a JSON object, not {type(record).__name__}"}
+	try:
+		name = record.get('cipher')
+		if name not in CIPHERS:
+			raise ValueError(f"unknown cipher {name!r}")
+		params = tuple(record.get(field) for field in CIPHERS[name][1])
+		missing = [field for field, p in zip(CIPHERS[name][1], params) if p is None and field not in OPTIONAL]
+		if missing or 'text' not in record:
+			raise ValueError(f"missing {', '.join(missing or ['text'])}")
+		for field, value in (*zip(CIPHERS[name][1], params), ('text', record['text'])):
+			if value is not None and not isinstance(value, str):
+				raise ValueError(f"{field} must be a string, not {type(value).__name__}")
+		encrypt, decrypt = cipher(name, params)
+		text = record['text']
+		mode = record.get('mode')
+		if mode is None:
+			mode = 'encrypt' if probe_text(text) else 'decrypt'
+		if mode not in ('encrypt', 'decrypt'):
+			raise ValueError(f"unknown mode {mode!r}")
+		result = {'text': encrypt(text) if mode == 'encrypt' else decrypt(text)}
+	except Exception as e:
+		# a record can only ever fail itself, whatever the cipher raised
+		result = {'error': str(e) or type(e).__name__}
+	if 'id' in record:
+		result = {'id': record['id'], **result}
+	return result
+
+
+def run_batch(records):
+	return [run(record) for record in records]
+
+
+def process(records, workers=None):
+	# results come back in input order, with or without workers
+	if workers is None:
+		yield from map(run, records)
+		return
+	from concurrent.futures import ProcessPoolExecutor
+	with ProcessPoolExecutor(workers) as executor:
+		yield from itertools.chain.from_iterable(executor.map(run_batch, chunks(list(records), BATCH_SIZE)))
+
+
+def main(argv=None):
+	import sys
+	import argparse
+	import cryptoargs
+
+	parser = argparse.ArgumentParser(prog='batch',
+		description='Applies ciphers to many messages, read as JSON objects one per line. '
+			'Each names a cipher (' + ', '.join(CIPHERS) + '), its key fields as on that cipher\'s command line '
+			'(key; horizontal, vertical; grid, word, coord), the text and optionally a mode (encrypt or decrypt) and an id. '
+			'Results are written one per line in the same order, as {"id", "text"} or {"id", "error"}.')
+	parser.add_argument('in_file', type=str, nargs='?', metavar='FILE', help='the records; read from STDIN by default')
+	parser.add_argument('-j', '--jobs', type=int, help='the number of worker processes; records are handled in this process by default')
+	cryptoargs.add_output(parser)
+	args = parser.parse_args(argv)
+
+	with open(args.in_file) if args.in_file is not None else sys.stdin as f:
+		cryptoargs.write_records(args, process(cryptoargs.read_records(f), args.jobs))
+
+
+if __name__ == '__main__':
+	main()
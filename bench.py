@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+import time
+import random
+import platform
+import subprocess
+from string import ascii_lowercase
+
+
+DEFAULT_SIZES = (1 << 10, 1 << 16, 1 << 20)
+# the slow per-letter reference paths only run at sizes up to this
+REFERENCE_LIMIT = 1 << 16
+REPEATS = 3
+DEFAULT_THRESHOLD = 0.10
+SEED = 1918
+
+
+def message(size, alphabet=ascii_lowercase):
+	return ''.join(random.Random(SEED).choices(alphabet, k=size))
+
+
+def best_time(func, repeats=REPEATS, reset=None):
+	best = float('inf')
+	for _ in range(repeats):
+		if reset is not None:
+			reset()
+		start = time.perf_counter()
+		func()
+		best = min(best, time.perf_counter() - start)
+	return best
+
+
+def cipher_cases():
+	# (name, alphabet, encrypt, decrypt, reset, reference only)
+	from batch import cipher
+	import enigma
+	import enigmacty
+
+	cases = []
+	for name, params, alphabet in (
+			('vigenere', ('LEMON',), ascii_lowercase),
+			('autokey', ('QUEEN',), ascii_lowercase),
+			('greenwall', ('HELLO', 'WORLD'), ascii_lowercase + ' ,.'),
+			('playfair', ('MONARCHY',), ascii_lowercase.replace('j', '')),
+			('adfgvx', ('PH0QG64MEA1YL2NOFDXKR3CVS5ZW7BJ9UTI8', 'GERMAN', None), ascii_lowercase)):
+		encrypt, decrypt = cipher(name, params)
+		cases.append((name, alphabet, encrypt, decrypt, None, False))
+
+	machine = enigmacty.default_enigma()
+	compiled = enigmacty.Enigma(machine._rotors, machine.reflector, compiled=True)
+	for name, e in (('enigmacty', machine), ('enigmacty.compiled', compiled)):
+		def reset(e=e):
+			e.position_index = 0
+		process = lambda text, e=e: e.process_text(text.upper())
+		cases.append((name, ascii_lowercase, process, process, reset, name == 'enigmacty'))
+
+	machine = enigma.default_enigma()
+	def reset():
+		machine.set_rotor_order((0, 1, 2))
+		machine.set_positions((0, 0, 0))
+	process = lambda text: machine.process_text(text.upper())
+	cases.append(('enigma', ascii_lowercase, process, process, reset, True))
+	return cases
+
+
+def bench_ciphers(sizes, results, progress):
+	for name, alphabet, encrypt, decrypt, reset, reference in cipher_cases():
+		for size in sizes:
+			if reference and size > REFERENCE_LIMIT:
+				continue
+			text = message(size, alphabet)
+			if reset is not None:
+				reset()
+			ciphertext = encrypt(text)
+			for mode, func, arg in (('encrypt', encrypt, text), ('decrypt', decrypt, ciphertext)):
+				seconds = best_time(lambda: func(arg), reset=reset)
+				key = f"{name}.{mode}/{size}"
+				results[key] = {'seconds': seconds, 'rate': size / seconds, 'unit': 'chars/s'}
+				progress(key, results[key])
+
+
+def bench_analysis(results, progress):
+	import enigma
+
+	machine = enigma.default_enigma()
+	machine.set_rotor_order((0, 1, 2))
+	machine.set_positions((0, 0, 0))
+	calls = 1000
+	seconds = best_time(lambda: [enigma.get_cycle_structure(machine) for _ in range(calls)])
+	results['get_cycle_structure'] = {'seconds': seconds, 'rate': calls / seconds, 'unit': 'calls/s'}
+	progress('get_cycle_structure', results['get_cycle_structure'])
+
+	# one rotor order of the six compute_cycles covers, without its worker pool
+	seconds = best_time(lambda: enigma.order_fingerprints((0, 1, 2)), repeats=1)
+	results['compute_cycles.order'] = {'seconds': seconds, 'rate': enigma.TOTAL_POSITIONS / seconds, 'unit': 'positions/s'}
+	progress('compute_cycles.order', results['compute_cycles.order'])
+
+
+def environment():
+	try:
+		commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+			cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+	except OSError:
+		commit = None
+	return {
+		'python': platform.python_version(),
+		'implementation': platform.python_implementation(),
+		'platform': platform.platform(),
+		'machine': platform.machine(),
+		'processor': platform.processor(),
+		'cpu_count': os.cpu_count(),
+		'commit': commit,
+		'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+	}
+
+
+def run(sizes=DEFAULT_SIZES, analysis=True, progress=lambda key, result: None):
+	results = {}
+	bench_ciphers(sizes, results, progress)
+	if analysis:
+		bench_analysis(results, progress)
+	return {'environment': environment(), 'sizes': list(sizes), 'results': results}
+
+
+def compare(base, new):
+	# (key, base seconds, new seconds, change) for every benchmark in both runs;
+	# change is the fractional increase in time, so positive is slower
+	rows = []
+	for key, result in new['results'].items():
+		if key in base['results']:
+			before, after = base['results'][key]['seconds'], result['seconds']
+			rows.append((key, before, after, after / before - 1))
+	return rows
+
+
+def fmt_rate(result):
+	rate = result['rate']
+	for factor, prefix in ((1e6, 'M'), (1e3, 'k')):
+		if rate >= factor:
+			return f"{rate / factor:.2f} {prefix}{result['unit']}"
+	return f"{rate:.2f} {result['unit']}"
+
+
+def main(argv=None):
+	import argparse
+
+	parser = argparse.ArgumentParser(prog='bench',
+		description='Times every cipher and the Enigma analysis routines, or compares two such runs.')
+	subparsers = parser.add_subparsers(dest='command', required=True)
+	run_parser = subparsers.add_parser('run', help='run the benchmarks and write the results as JSON')
+	run_parser.add_argument('-o', '--output', type=str, metavar='FILE', help='destination for the JSON results; print to STDOUT by default')
+	run_parser.add_argument('-s', '--sizes', type=int, nargs='+', default=DEFAULT_SIZES, metavar='SIZE',
+		help='message sizes in letters (default ' + ' '.join(map(str, DEFAULT_SIZES)) + ')')
+	run_parser.add_argument('--no-analysis', action='store_true', help='skip get_cycle_structure and compute_cycles')
+	compare_parser = subparsers.add_parser('compare', help='report the change between two runs, failing on regressions')
+	compare_parser.add_argument('base', type=str, help='the earlier results')
+	compare_parser.add_argument('new', type=str, help='the later results')
+	compare_parser.add_argument('-t', '--threshold', type=float, default=DEFAULT_THRESHOLD,
+		help=f'the slowdown that counts as a regression (default {DEFAULT_THRESHOLD})')
+	args = parser.parse_args(argv)
+
+	if args.command == 'run':
+		def progress(key, result):
+			print(f"{key:36} {fmt_rate(result)}", file=sys.stderr)
+
+		report = json.dumps(run(args.sizes, not args.no_analysis, progress), indent=1)
+		if args.output is not None:
+			with open(args.output, 'w') as f:
+				f.write(report + '\n')
+		else:
+			print(report)
+		return
+
+	with open(args.base) as f:
+		base = json.load(f)
+	with open(args.new) as f:
+		new = json.load(f)
+	rows = compare(base, new)
+	if not rows:
+		sys.exit("the two runs have no benchmarks in common")
+	regressions = 0
+	for key, before, after, change in rows:
+		flag = ''
+		if change > args.threshold:
+			flag = '  REGRESSION'
+			regressions += 1
+		print(f"{key:36} {before * 1e3:10.3f}ms {after * 1e3:10.3f}ms {change:+8.1%}{flag}")
+	if regressions:
+		sys.exit(f"{regressions} regression(s) over {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,170 @@
+import itertools
+from crypto import acode, normalize
+from enigmacty import default_enigma, letter
+
+TOTAL_POSITIONS = 26**3
+SHARD_SIZE = 26**2
+UNKNOWN = 0xFF
+
+
+def valid_offsets(ciphertext, crib):
+	# a letter never encrypts to itself, so the crib cannot sit where it lines up with itself
+	for offset in range(len(ciphertext) - len(crib) + 1):
+		if all(p != c for p, c in zip(crib, ciphertext[offset:])):
+			yield offset
+
+
+def check_crib(ciphertext, crib, offset=None):
+	if not crib:
+		raise ValueError("the crib must contain at least one letter")
+	if len(crib) > len(ciphertext):
+		raise ValueError(f"the crib ({len(crib)} letters) is longer than the ciphertext ({len(ciphertext)} letters)")
+	if offset is None:
+		return
+	if not 0 <= offset <= len(ciphertext) - len(crib):
+		raise ValueError(f"offset {offset} does not fit the crib in the ciphertext (0-{len(ciphertext) - len(crib)})")
+	clashes = [str(offset + i) for i, (p, c) in enumerate(zip(crib, ciphertext[offset:])) if p == c]
+	if clashes:
+		raise ValueError(f"the crib would encrypt a letter to itself at position {', '.join(clashes)}")
+
+
+def create_menu(plain, cipher):
+	# the crib as a graph: each position i links its plain and cipher letters
+	menu = [[] for _ in range(26)]
+	for i, (p, c) in enumerate(zip(plain, cipher)):
+		menu[p].append((c, i))
+		menu[c].append((p, i))
+	return menu
+
+
+def components(menu):
+	seen = set()
+	for start in range(26):
+		if start in seen or not menu[start]:
+			continue
+		component = [start]
+		seen.add(start)
+		for a in component:
+			for b, _ in menu[a]:
+				if b not in seen:
+					seen.add(b)
+					component.append(b)
+		yield component
+
+
+def menu_loops(menu):
+	# only components with a loop can contradict a stecker hypothesis by themselves
+	result = []
+	for component in components(menu):
+		edges = sum(len(menu[a]) for a in component) // 2
+		if edges >= len(component):
+			result.append(component)
+	if not result:
+		largest = max(components(menu), key=len, default=None)
+		if largest is None:
+			raise ValueError("the crib gives an empty menu")
+		result = [largest]
+	# test each component at its best connected letter
+	return [max(component, key=lambda a: len(menu[a])) for component in result]
+
+
+def propagate(table, base, menu, stecker, a, b):
+	# assumes a and b are steckered and follows every consequence through the menu;
+	# returns False on a contradiction
+	pending = [(a, b)]
+	while pending:
+		a, b = pending.pop()
+		if stecker[a] == b:
+			continue
+		if stecker[a] != UNKNOWN or stecker[b] != UNKNOWN:
+			return False
+		stecker[a] = b
+		stecker[b] = a
+		for x, y in ((a, b), (b, a)) if a != b else ((a, b),):
+			for other, i in menu[x]:
+				pending.append((other, table[(base + i) % TOTAL_POSITIONS * 26 + y]))
+	return True
+
+
+def solve(table, base, menu, tests, stecker):
+	if not tests:
+		yield stecker
+		return
+	test, *rest = tests
+	if stecker[test] != UNKNOWN:
+		yield from solve(table, base, menu, rest, stecker)
+		return
+	for guess in range(26):
+		trial = bytearray(stecker)
+		if propagate(table, base, menu, trial, test, guess):
+			yield from solve(table, base, menu, rest, trial)
+
+
+def fmt_stecker(stecker):
+	return ' '.join(letter(a) + letter(b) for a, b in enumerate(stecker) if a <= b != UNKNOWN)
+
+
+def search_shard(order, first, last, ciphertext, crib, offsets):
+	enigma = default_enigma()
+	enigma.set_rotor_order(order)
+	table = enigma.compiled_table()
+	plain = [acode(c) for c in crib]
+	hits = []
+	for offset in offsets:
+		cipher = [acode(c) for c in ciphertext[offset:offset + len(crib)]]
+		menu = create_menu(plain, cipher)
+		tests = menu_loops(menu)
+		for start in range(first, last):
+			for stecker in solve(table, start + offset, menu, tests, bytearray([UNKNOWN] * 26)):
+				trigraph = ''.join(letter(start // 26**i % 26) for i in range(3))
+				hits.append((order, trigraph, offset, fmt_stecker(stecker)))
+	return hits
+
+
+def search(ciphertext, crib, offset=None, workers=None, progress=None):
+	from concurrent.futures import ProcessPoolExecutor, as_completed
+	ciphertext = normalize(ciphertext).upper()
+	crib = normalize(crib).upper()
+	check_crib(ciphertext, crib, offset)
+	offsets = list(valid_offsets(ciphertext, crib)) if offset is None else [offset]
+
+	shards = [(order, first, first + SHARD_SIZE)
+		for order in itertools.permutations(range(3))
+		for first in range(0, TOTAL_POSITIONS, SHARD_SIZE)]
+	hits = []
+	with ProcessPoolExecutor(workers) as executor:
+		futures = [executor.submit(search_shard, *shard, ciphertext, crib, offsets) for shard in shards]
+		for done, future in enumerate(as_completed(futures), start=1):
+			hits.extend(future.result())
+			if progress is not None:
+				progress(done, len(futures))
+	hits.sort()
+	return hits
+
+
+def main(argv=None):
+	import sys
+	import argparse
+
+	parser = argparse.ArgumentParser(prog='bombe',
+		description='Searches for the Enigma rotor orders, start positions and steckers that can encrypt a crib to part of a ciphertext.')
+	parser.add_argument('ciphertext', type=str, help='the intercepted message')
+	parser.add_argument('-c', '--crib', type=str, required=True, help='the suspected plaintext')
+	parser.add_argument('-o', '--offset', type=int, help='the position of the crib in the message; every possible position is tried by default')
+	parser.add_argument('-j', '--jobs', type=int, help='the number of worker processes')
+	args = parser.parse_args(argv)
+
+	def report(done, total):
+		print(f"\r{done}/{total} shards", end='', file=sys.stderr, flush=True)
+
+	try:
+		hits = search(args.ciphertext, args.crib, args.offset, args.jobs, report)
+	except ValueError as e:
+		parser.error(str(e))
+	print(file=sys.stderr)
+	for order, trigraph, offset, stecker in hits:
+		print(f"{''.join(map(str, order))} {trigraph} +{offset}: {stecker}")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,75 @@
+import sys
+import itertools
+import importlib
+
+
+# each command is a module with a main(argv); only the chosen one is imported
+COMMANDS = {
+	'vigenere': 'the Vigenère cipher, with one-time pads and key recovery',
+	'autokey': 'the Autokey cipher',
+	'greenwall': 'the Greenwall cipher',
+	'playfair': 'the Playfair cipher, with key recovery',
+	'adfgvx': 'the ADFGVX cipher, with key recovery',
+	'enigma': 'the Enigma machine, and its cycle fingerprint catalog',
+	'bombe': 'search for Enigma settings from a crib',
+	'keygen': 'generate random keys, pads and grids',
+	'batch': 'apply ciphers to many messages from a JSONL file',
+	'bench': 'time the ciphers and analysis routines, or compare two runs',
+}
+
+
+# options taking a value, then flags; all of them come before the command
+OPTIONS = {
+	'--stats': 'FILE  count calls, characters and latency, and write them to FILE as JSON (- for STDERR)',
+	'--profile': 'FILE  run the command under cProfile and save the profile to FILE',
+}
+FLAGS = {
+	'--memory': 'trace allocations and report the peak and the largest sites on STDERR',
+}
+
+
+def usage():
+	width = max(map(len, COMMANDS))
+	lines = ['usage: ciphers [OPTIONS] COMMAND [ARGS...]', '', 'Classical ciphers and tools. Run a command with -h for its options.', '', 'commands:']
+	lines.extend(f"  {name:{width}}  {help}" for name, help in COMMANDS.items())
+	lines.extend(['', 'options:'])
+	lines.extend(f"  {name} {help}" for name, help in itertools.chain(OPTIONS.items(), FLAGS.items()))
+	return '\n'.join(lines)
+
+
+def main(argv=None):
+	argv = sys.argv[1:] if argv is None else argv
+	options = {}
+	while argv and (argv[0] in OPTIONS or argv[0] in FLAGS):
+		option, *argv = argv
+		if option in FLAGS:
+			options[option] = True
+		elif argv:
+			options[option], *argv = argv
+		else:
+			sys.exit(f"ciphers: {option} needs a value")
+	if not argv or argv[0] in ('-h', '--help'):
+		print(usage())
+		return
+	command, *args = argv
+	if command not in COMMANDS:
+		sys.exit(f"{usage()}\n\nciphers: unknown command {command!r}")
+	module = importlib.import_module(command)
+
+	stats = options.get('--stats')
+	if stats is not None:
+		import instrument
+		instrument.enable()
+	try:
+		if '--profile' in options or '--memory' in options:
+			import instrument
+			instrument.capture(lambda: module.main(args), options.get('--profile'), options.get('--memory', False))
+		else:
+			module.main(args)
+	finally:
+		if stats is not None:
+			instrument.dump(stats)
+
+
+if __name__ == '__main__':
+	main()
@@ -1,12 +1,27 @@
+import re
+import sys
+import math
 import itertools
 import collections
 import string
+import mmap
+import unicodedata
+import instrument
+from array import array
 from abc import ABC
+from functools import lru_cache
 
 
 OFFSET_UPPER = ord('A')
 OFFSET_LOWER = ord('a')
 
+# relative frequency of each letter in English text, A to Z
+ENGLISH_FREQUENCIES = [
+	0.0817, 0.0149, 0.0278, 0.0425, 0.1270, 0.0223, 0.0202, 0.0609, 0.0697,
+	0.0015, 0.0077, 0.0403, 0.0241, 0.0675, 0.0751, 0.0193, 0.0010, 0.0599,
+	0.0633, 0.0906, 0.0276, 0.0098, 0.0236, 0.0015, 0.0197, 0.0007,
+]
+
 
 def acode(c):
 	return (ord(c) - OFFSET_UPPER) & 0x1F
@@ -36,62 +51,296 @@ def grid_lookup25(grid, alias='I', missing='J'):
 	return lookup
 
 
-def create_trans(chars=''):
-	trans = [''] * 128
-	for c in itertools.chain(string.ascii_letters, chars):
-		trans[ord(c)] = c
-	return trans
+# letters that have no decomposition but a conventional ascii spelling
+FOLD_SPECIAL = {
+	'ß': 'ss', 'ẞ': 'SS', 'æ': 'ae', 'Æ': 'AE', 'œ': 'oe', 'Œ': 'OE', 'þ': 'th', 'Þ': 'TH',
+	'ø': 'o', 'Ø': 'O', 'ł': 'l', 'Ł': 'L', 'đ': 'd', 'Đ': 'D', 'ð': 'd', 'Ð': 'D', 'ı': 'i', 'ħ': 'h', 'Ħ': 'H',
+}
+# past this many distinct characters to fold, one translate of the whole text beats a replace for each
+FOLD_REPLACE_LIMIT = 32
+NON_ASCII = re.compile('[^\x00-\x7f]')
+
+
+def fold(c):
+	# the ascii spelling of a character: without accents, with compatibility forms and ligatures spelt out
+	special = FOLD_SPECIAL.get(c)
+	if special is not None:
+		return special
+	# only decimal digits (fullwidth ones, say) fold to digits: the digits in the forms of
+	# fractions (½ is 1⁄2), superscripts and circled numbers are dropped, as they would run
+	# into the digits around them
+	return ''.join(d for d in unicodedata.normalize('NFKD', c) if d.isascii() and (c.isdecimal() or not d.isdigit()))
+
+
+class FoldTable(dict):
+	# a str.translate table that folds each character the first time it is seen
+
+	def __missing__(self, i):
+		result = self[i] = fold(chr(i))
+		return result
+
+
+FOLDS = FoldTable()
+
 
+# latin-1 text is folded as bytes: first the letters spelt with more than one, then the rest
+# through a table, where anything with no spelling becomes a byte that is always deleted
+LATIN_SPELLINGS = [(bytes([i]), fold(chr(i)).encode('ascii')) for i in range(0x80, 0x100) if len(fold(chr(i))) > 1]
+LATIN_FOLDS = bytes(ord(fold(chr(i))) if len(fold(chr(i))) == 1 else 0x80 for i in range(0x100))
 
-TRANS_DEFAULT = create_trans()
 
+@lru_cache(maxsize=None)
+def deletions(keep=''):
+	# every byte but the ascii letters and keep
+	return bytes(range(256)).translate(None, (string.ascii_letters + keep).encode('ascii'))
 
-def normalize(text):
-	return text.translate(TRANS_DEFAULT)
+
+def normalize(text, keep=''):
+	# the letters of text folded to ascii, and any of the ascii characters in keep.
+	# each character is folded on its own, so a stream can be normalized chunk by chunk
+	if text.isascii():
+		data = text.encode('ascii')
+	else:
+		try:
+			data = text.encode('latin-1')
+		except UnicodeEncodeError:
+			data = fold_text(text).encode('ascii')
+		else:
+			for c, spelling in LATIN_SPELLINGS:
+				if c in data:
+					data = data.replace(c, spelling)
+			data = data.translate(LATIN_FOLDS)
+	return data.translate(None, deletions(keep)).decode('ascii')
+
+
+def fold_text(text):
+	# replaces each distinct non-ascii character throughout, or translates them all if there are many
+	pos = 0
+	for _ in range(FOLD_REPLACE_LIMIT):
+		match = NON_ASCII.search(text, pos)
+		if match is None:
+			return text
+		pos = match.start()
+		text = text.replace(match.group(), FOLDS[ord(match.group())])
+	return text.translate(FOLDS)
+
+
+# the code of a byte outside a custom alphabet
+INVALID = 0xFF
+
+
+def recase(letters, func):
+	# func (str.upper or str.lower) of each symbol, where that is still one latin-1 character
+	return ''.join(d if len(d) == 1 and ord(d) <= 0xFF else c for c, d in zip(letters, map(func, letters)))
 
 
 class Alphabet(ABC):
+	# symbols numbered from 0, compiled into translation tables over latin-1 bytes:
+	# codes maps each byte to its code, and upper/lower map any byte value back to the
+	# symbol whose code it is modulo the size, so sums need not be reduced first
+
+	def __init__(self, letters, codes):
+		self.letters = letters
+		self.size = len(letters)
+		self.codes = codes
+		self.upper = (recase(letters, str.upper) * (256 // self.size + 1))[:256].encode('latin-1')
+		self.lower = (recase(letters, str.lower) * (256 // self.size + 1))[:256].encode('latin-1')
 
 	def encode(self, c):
 		raise NotImplementedError
 	
 	def decode(self, a):
-		raise NotImplementedError
+		return self.letters[a]
+
+	def check(self, data):
+		# raises ValueError if the latin-1 bytes data hold anything outside the alphabet
+		pass
+
+	def encode_all(self, text):
+		# the codes of a string or byte buffer, as bytes
+		if isinstance(text, str):
+			try:
+				text = text.encode('latin-1')
+			except UnicodeEncodeError:
+				return bytes(map(self.encode, text))
+		self.check(text)
+		return text.translate(self.codes)
+
+	def decode_all(self, codes, lower=False):
+		return codes.translate(self.lower if lower else self.upper).decode('latin-1')
+
+	def table(self, func, lower=False):
+		# the bytes of text straight to the symbols for func of their codes, for ciphers
+		# that transform each code alone; bytes outside the alphabet are left to check
+		result = self.lower if lower else self.upper
+		return bytes(result[func(a) % self.size] for a in self.codes)
 
 
 class StandardAlphabet(Alphabet):
+	# the letters A to Z, then any extra symbols; any other character gets the code
+	# of the letter sharing its low bits
 	
-	def encode(self, c):
-		return acode(c)
+	def __init__(self, extra=''):
+		codes = bytearray((c - OFFSET_UPPER) & 0x1F for c in range(256))
+		for a, c in enumerate(extra, start=26):
+			codes[ord(recase(c, str.upper))] = a
+			codes[ord(recase(c, str.lower))] = a
+		super().__init__(string.ascii_uppercase + extra, bytes(codes))
 	
-	def decode(self, a):
-		return chr(a + OFFSET_UPPER)
+	def encode(self, c):
+		i = ord(c)
+		return self.codes[i] if i < 256 else acode(c)
 
 
 ALPHABET = StandardAlphabet()
 
 
 class CustomAlphabet(Alphabet):
+	# any sequence of distinct latin-1 symbols, in either case; anything else is an error
 	
 	def __init__(self, alphabet):
+		if len(set(recase(alphabet, str.upper))) != len(alphabet) or not 0 < len(alphabet) < INVALID:
+			raise ValueError(f"alphabet {alphabet!r} must have between 1 and {INVALID - 1} distinct symbols")
+		if any(ord(c) > 0xFF for c in alphabet):
+			raise ValueError(f"alphabet {alphabet!r} must be latin-1")
 		self.seq = alphabet
-		table = [None] * 128
+		codes = bytearray([INVALID]) * 256
 		for a, c in enumerate(alphabet):
-			table[ord(c.upper())] = a
-			table[ord(c.lower())] = a
-		self._table = table
+			codes[ord(recase(c, str.upper))] = a
+			codes[ord(recase(c, str.lower))] = a
+		super().__init__(alphabet, bytes(codes))
+		self.symbols = bytes(i for i, a in enumerate(codes) if a != INVALID)
 
 	def encode(self, c):
-		a = self._table[ord(c)]
-		if a is None:
-			raise ValueError
+		a = self.codes[ord(c)] if ord(c) < 256 else INVALID
+		if a == INVALID:
+			raise ValueError(f"{c!r} is not in the alphabet {self.letters!r}")
 		return a
-	
-	def decode(self, a):
-		return self.alphabet[a]
+
+	def check(self, data):
+		missing = data.translate(None, self.symbols)
+		if missing:
+			raise ValueError(f"{''.join(sorted(set(missing.decode('latin-1'))))!r} not in the alphabet {self.letters!r}")
+
+
+QUADGRAM_MAGIC = b'QGRAMF32'
+QUADGRAM_COUNT = 26 ** 4
+QUADGRAM_STRIDES = (17576, 676, 26, 1)
+# codes past Z (the digits of a 6x6 grid) score like Z, which is close to the floor
+QUADGRAM_CLAMP = bytes(min(a, 25) for a in range(256))
+
+
+def quadgram_indices(plain):
+	# the dense index of every quadgram in plain, a bytes of letter codes.
+	# each code gets its own 32-bit digit of one big integer, so the four shifted
+	# sums of a*17576 + b*676 + c*26 + d happen at once and never carry
+	count = len(plain) - 3
+	if count < 1:
+		return array('I')
+	digits = bytearray(4 * len(plain))
+	digits[0::4] = plain.translate(QUADGRAM_CLAMP)
+	n = int.from_bytes(digits, 'little')
+	n = sum((n >> 32 * k) * stride for k, stride in enumerate(QUADGRAM_STRIDES))
+	indices = array('I', n.to_bytes(len(digits), 'little'))
+	if sys.byteorder == 'big':
+		indices.byteswap()
+	del indices[count:]
+	return indices
+
+
+class Quadgrams:
+	# log10 quadgram probabilities as a flat float32 table, either built in memory
+	# or memory-mapped from a file so that worker processes share the same pages
+
+	def __init__(self, table, path=None):
+		self.table = table
+		self.path = path
+		self._map = None
+
+	@classmethod
+	def from_corpus(cls, corpus):
+		codes = bytes(acode(c) for c in normalize(corpus))
+		counts = collections.Counter(quadgram_indices(codes))
+		total = sum(counts.values())
+		table = array('f', [math.log10(0.01 / total)]) * QUADGRAM_COUNT
+		for i, n in counts.items():
+			table[i] = math.log10(n / total)
+		return cls(table)
+
+	@classmethod
+	def load(cls, path):
+		with open(path, 'rb') as f:
+			if f.read(len(QUADGRAM_MAGIC)) != QUADGRAM_MAGIC:
+				raise ValueError(f"{path} is not a quadgram table")
+			m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		if len(m) != len(QUADGRAM_MAGIC) + 4 * QUADGRAM_COUNT:
+			m.close()
+			raise ValueError(f"{path} is not a quadgram table")
+		if sys.byteorder == 'big':
+			# tables are saved little-endian, so this host reads a swapped copy instead
+			table = array('f', m[len(QUADGRAM_MAGIC):])
+			table.byteswap()
+			m.close()
+			return cls(table, path)
+		quadgrams = cls(memoryview(m)[len(QUADGRAM_MAGIC):].cast('f'), path)
+		quadgrams._map = m
+		return quadgrams
+
+	@classmethod
+	def open(cls, path):
+		# a saved table, or else a text file to build one from
+		with open(path, 'rb') as f:
+			if f.read(len(QUADGRAM_MAGIC)) == QUADGRAM_MAGIC:
+				return cls.load(path)
+		with open(path) as f:
+			return cls.from_corpus(f.read())
+
+	def save(self, path):
+		table = self.table if isinstance(self.table, array) else array('f', self.table)
+		if sys.byteorder == 'big':
+			table = array('f', table)
+			table.byteswap()
+		with open(path, 'wb') as f:
+			f.write(QUADGRAM_MAGIC)
+			table.tofile(f)
+
+	def score(self, plain):
+		return sum(map(self.table.__getitem__, quadgram_indices(plain)))
+
+	def rescore(self, old, new, positions):
+		# the change in score from old to new, where they differ only at positions
+		last = len(new) - 4
+		starts = sorted({s for p in positions for s in range(max(p - 3, 0), min(p, last) + 1)})
+		table = self.table
+		delta = 0.0
+		for s in starts:
+			a, b, c, d = new[s:s + 4].translate(QUADGRAM_CLAMP)
+			delta += table[a * 17576 + b * 676 + c * 26 + d]
+			a, b, c, d = old[s:s + 4].translate(QUADGRAM_CLAMP)
+			delta -= table[a * 17576 + b * 676 + c * 26 + d]
+		return delta
+
+	def close(self):
+		if self._map is not None:
+			self.table.release()
+			self._map.close()
+			self._map = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def __reduce__(self):
+		# workers reopen a mapped table rather than copying it
+		if self.path is not None:
+			return Quadgrams.load, (self.path,)
+		return Quadgrams, (self.table,)
 
 
 def join_result(func):
+	@instrument.measured(f"{func.__module__}.{func.__qualname__}", len)
 	def joiner(*args, **kwargs):
 		return ''.join(func(*args, **kwargs))
 	return joiner
@@ -112,3 +361,26 @@ def chunks_iter(iterator, size):
 		if not chunk:
 			return
 		yield chunk
+
+
+def use_pool(text, workers, parallel_size):
+	# a pool is only started when workers are asked for, and only for a text long
+	# enough to make up for starting it
+	return workers is not None and workers != 1 and len(text) >= parallel_size
+
+
+def main(argv=None):
+	import argparse
+
+	parser = argparse.ArgumentParser(prog='crypto',
+		description='Builds the quadgram table the solvers score candidates with from the English text in CORPUS.')
+	parser.add_argument('corpus', type=str, help='the text file to count quadgrams in')
+	parser.add_argument('table', type=str, help='the file to write the table to')
+	args = parser.parse_args(argv)
+
+	with open(args.corpus) as f:
+		Quadgrams.from_corpus(f.read()).save(args.table)
+
+
+if __name__ == '__main__':
+	main()
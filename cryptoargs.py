@@ -1,9 +1,12 @@
+import json
+import itertools
 import crypto
 
 MODE_INSTRUCTIONS = 'A message starting with a lower-case letter is assumed plaintext to be encrypted (with upper-case output), and the inverse is also true. Encrypt/decrypt can be forced with optional flags.'
 
 MESSAGE = 'message'
 IN_FILE = 'in_file'
+CHUNK_SIZE = 1 << 20
 
 
 def add_input(parser):
@@ -34,13 +37,29 @@ def get_input(args):
 	return str_or_file(args, MESSAGE, IN_FILE)
 
 
+def read_chunks(args, size=CHUNK_SIZE):
+	text = getattr(args, MESSAGE)
+	if text is not None:
+		yield text
+		return
+	with open(getattr(args, IN_FILE)) as f:
+		while chunk := f.read(size):
+			yield chunk
+
+
 def write_result(args, result):
+	write_chunks(args, [result])
+
+
+def write_chunks(args, chunks):
 	file = args.out_file
 	if file is not None:
 		with open(file, 'w') as f:
-			f.write(result)
+			for chunk in chunks:
+				f.write(chunk)
 	else:
-		print(result, end='')
+		for chunk in chunks:
+			print(chunk, end='', flush=True)
 
 
 def get_mode(args, encrypt=True, decrypt=False, default=None):
@@ -56,3 +75,29 @@ def probe_text(text):
 		if c.isalpha():
 			return c.islower()
 	return True
+
+
+def probe_chunks(chunks):
+	# returns the probe result and the chunks, including the ones consumed while probing
+	chunks = iter(chunks)
+	seen = []
+	for chunk in chunks:
+		seen.append(chunk)
+		if any(c.isalpha() for c in chunk):
+			return probe_text(chunk), itertools.chain(seen, chunks)
+	return True, iter(seen)
+
+
+def read_records(file):
+	# one JSON object per line; blank lines are skipped, and a line that is not
+	# JSON is passed on as its JSONDecodeError so that it can still be answered
+	for line in file:
+		if line.strip():
+			try:
+				yield json.loads(line)
+			except json.JSONDecodeError as e:
+				yield e
+
+
+def write_records(args, records):
+	write_chunks(args, (json.dumps(record) + '\n' for record in records))
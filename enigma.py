@@ -1,11 +1,17 @@
 import itertools
-from enum import IntEnum
-from collections import Counter, deque
+import hashlib
+import mmap
+import struct
+import instrument
+from collections import Counter
 from typing import Iterable
+from enigmacore import Direction, RotorMachine, compile_rotors, padded, PARALLEL_SIZE
+from crypto import use_pool
 
 ORD_A = ord('A')
 TOTAL_POSITIONS = 26**3
 TOTAL_SETTINGS = TOTAL_POSITIONS * 6
+ORDERS = list(itertools.permutations(range(3)))
 
 
 def letter(a):
@@ -16,11 +22,6 @@ def code(a):
     return ord(a) - ORD_A
 
 
-class Direction(IntEnum):
-    FORWARD = 0
-    BACKWARD = 1
-
-
 class Rotor:
 
     def __init__(self, name, offsets: list[int]):
@@ -41,8 +42,13 @@ class Rotor:
     def backward(self, a):
         return self._apply(a, Direction.BACKWARD)
 
-    def _apply(self, a, direction: Direction):
-        return (a + self.wiring[(a - self.pos) % 26][direction]) % 26
+    def _apply(self, a, direction: Direction, pos=None):
+        if pos is None:
+            pos = self.pos
+        return (a + self.wiring[(a - pos) % 26][direction]) % 26
+
+    def table(self, pos, direction: Direction):
+        return bytes(self._apply(a, direction, pos) for a in range(26))
 
     def rotate(self):
         self.pos += 1
@@ -76,45 +82,13 @@ def create_reflector(s):
     return table
 
 
-class Enigma:
-    def __init__(self, rotors: list[Rotor], reflector):
-        self.plugboard = create_plugboard([])
-        self._rotors = rotors
-        self.rotor_order = list(rotors)
-        self.reflector = reflector
-
-    def process_text(self, text):
+class Enigma(RotorMachine):
+    @instrument.measured('enigma.Enigma.process_text', len)
+    def process_text(self, text, workers=None):
+        if use_pool(text, workers, PARALLEL_SIZE):
+            return self.process_windows(text, workers)
         return ''.join(letter(a) for a in self.process(code(c) for c in text))
 
-    def process(self, seq):
-        for a in seq:
-            yield self.apply(a)
-            self.advance()
-
-    def apply(self, a):
-        a = self.plugboard[a]
-        for rotor in self.rotor_order:
-            a = rotor.forward(a)
-        a = self.reflector[a]
-        for rotor in reversed(self.rotor_order):
-            a = rotor.backward(a)
-        a = self.plugboard[a]
-        return a
-
-    def advance(self, amount=1):
-        for _ in range(amount):
-            for rotor in self.rotor_order:
-                complete_revolution = rotor.rotate()
-                if not complete_revolution:
-                    break
-
-    def set_rotor_order(self, order):
-        self.rotor_order = [self._rotors[i] for i in order]
-
-    def set_positions(self, positions):
-        for rotor, pos in zip(self.rotor_order, positions):
-            rotor.set_position(pos)
-
     def set_trigraph(self, tri):
         self.set_positions([code(a) for a in tri])
 
@@ -122,25 +96,19 @@ class Enigma:
     def trigraph(self):
         return ''.join(letter(r.pos) for r in self.rotor_order)
 
-    @property
-    def positions(self):
-        return tuple(r.pos for r in self.rotor_order)
-
-
-r1 = Rotor.from_str('Rotor 1', 'EKMFLGDQVZNTOWYHXUSPAIBRCJ')
-r2 = Rotor.from_str('Rotor 2', 'AJDKSIRUXBLHWTMCQGZNPYFVOE')
-r3 = Rotor.from_str('Rotor 3', 'BDFHJLCPRTXVZNYEIWGAKMUSQO')
-ref = create_reflector('YRUHQSLDPXNGOKMIEBFZCWVJAT')
+    def position_tables(self):
+        # the permutation at every position, in the order advance() visits them from AAA
+        plugboard = padded(self.plugboard)
+        return [plugboard[:26].translate(table).translate(plugboard) for table in compile_rotors(self.rotor_order, self.reflector)]
 
-enigma = Enigma([r1, r2, r3], ref)
-# print(enigma.encrypt('AAAAA'))
 
-
-def create_lookup(table):
-    lookup = [0] * 26
-    for i, a in enumerate(table):
-        lookup[a] = i
-    return lookup
+def default_enigma():
+    # a new machine each call, so that callers can set it up independently
+    r1 = Rotor.from_str('Rotor 1', 'EKMFLGDQVZNTOWYHXUSPAIBRCJ')
+    r2 = Rotor.from_str('Rotor 2', 'AJDKSIRUXBLHWTMCQGZNPYFVOE')
+    r3 = Rotor.from_str('Rotor 3', 'BDFHJLCPRTXVZNYEIWGAKMUSQO')
+    ref = create_reflector('YRUHQSLDPXNGOKMIEBFZCWVJAT')
+    return Enigma([r1, r2, r3], ref)
 
 
 def letters(seq):
@@ -148,11 +116,8 @@ def letters(seq):
 
 
 def get_cycle_structure(enigma: Enigma):
-    positions = enigma.positions
-    table = [enigma.apply(a) for a in range(26)]
-    enigma.advance(3)
-    table_plus3 = [enigma.apply(a) for a in range(26)]
-    enigma.set_positions(positions)
+    table = enigma.permutation()
+    table_plus3 = enigma.permutation(offset=3)
     seen = set()
     cycles = []
     for a in table:
@@ -175,60 +140,173 @@ def fmt_cycles(structure: set[tuple[int, int]]):
             yield str(length)
 
 
-def compute_cycles():
-    fingerprints = Counter()
-
-    for positions in itertools.permutations(range(3)):
-        enigma.set_rotor_order(positions)
+def cycle_type(perm):
+    seen = bytearray(26)
+    lengths = Counter()
+    for a in range(26):
+        length = 0
+        while not seen[a]:
+            seen[a] = 1
+            a = perm[a]
+            length += 1
+        if length:
+            lengths[length] += 1
+    return frozenset(lengths.items())
+
+
+def fmt_fingerprint(structures):
+    return '/'.join(','.join(fmt_cycles(s)) for s in structures)
+
+
+def order_structures(order):
+    # the fingerprint of every start position, in position index order
+    enigma = default_enigma()
+    enigma.set_rotor_order(order)
+    tables = enigma.position_tables()
+    # every table is an involution, so composing with it is also composing with its inverse
+    composed = (table.translate(padded(tables[(i + 3) % TOTAL_POSITIONS])) for i, table in enumerate(tables))
+    # few distinct structures exist, so share them rather than storing one per position
+    structures = {}
+    cycle_structures = []
+    for perm in composed:
+        structure = structures.get(perm)
+        if structure is None:
+            structure = structures[perm] = cycle_type(perm)
+        cycle_structures.append(structure)
+
+    return [tuple(cycle_structures[(i + j) % TOTAL_POSITIONS] for j in range(3)) for i in range(TOTAL_POSITIONS)]
+
+
+def order_fingerprints(order):
+    return Counter(order_structures(order))
+
+
+def compute_cycles(workers=None):
+    from concurrent.futures import ProcessPoolExecutor
+    enigma = default_enigma()
+    orders = ORDERS
+    for order in orders:
+        enigma.set_rotor_order(order)
         enigma.set_trigraph('AAA')
         print(enigma.rotor_order, enigma.process_text('AAAAA'))
         enigma.set_trigraph('AAA')
 
-        history: deque = deque([None])
-        for _ in range(3):
-            history.append([enigma.apply(a) for a in range(26)])
-            enigma.advance()
-
-        cycle_structures = []
-        for _ in range(TOTAL_POSITIONS):
-            history.rotate(-1)
-            future = [enigma.apply(a) for a in range(26)]
-            enigma.advance()
-            history[3] = future
-            current = history[0]
-            lookup = create_lookup(current)
-
-            seen = set()
-            cycles = Counter()
-            for a in current:
-                if a in seen:
-                    continue
-                start = a
-                cycle_length = 1
-                while True:
-                    seen.add(a)
-                    a = future[lookup[a]]
-                    if a == start:
-                        break
-                    cycle_length += 1
-                cycles[cycle_length] += 1
-
-            cycle_structures.append(cycles)
-
-        # TODO: fancy way of reducing space
-
-        for i in range(TOTAL_POSITIONS):
-            fingerprints[tuple(frozenset(cycle_structures[(i + j) % TOTAL_POSITIONS].items()) for j in range(3))] += 1
+    # merged in rotor order so that ties print in the order they were first seen
+    fingerprints = Counter()
+    with ProcessPoolExecutor(workers) as executor:
+        for counts in executor.map(order_fingerprints, orders):
+            fingerprints.update(counts)
 
     total = 0
     for structures, count in sorted(fingerprints.items(), key=lambda t: t[1]):
         total += count
         print(f"{count:4} instances ({count / TOTAL_SETTINGS:.2%}; {total / TOTAL_SETTINGS:.2%}): "
-              f"{'/'.join(','.join(fmt_cycles(s)) for s in structures)}")
+              f"{fmt_fingerprint(structures)}")
 
     # print(f"{total / TOTAL_SETTINGS:.2%}")
 
 
+# catalog file: header, then an open-addressing hash table of fingerprints,
+# then the settings (order index * TOTAL_POSITIONS + position index) of each
+CATALOG_MAGIC = b'ENIGCYC2'
+CATALOG_HEADER = struct.Struct('<8sII')
+CATALOG_SLOT = struct.Struct('<QIIII')
+CATALOG_SETTING = struct.Struct('<I')
+
+
+def catalog_key(fingerprint):
+    # accepts fmt_fingerprint output or the observed cycle lengths in any order, e.g. '13/1,12/13'
+    parts = fingerprint.split('/')
+    if len(parts) != 3:
+        raise ValueError(f"fingerprint needs three cycle structures but had {len(parts)}")
+    return '/'.join(','.join(map(str, sorted(map(int, p.split(',')), reverse=True))) for p in parts)
+
+
+def catalog_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode('ascii'), digest_size=8).digest(), 'little')
+
+
+def decode_setting(setting):
+    order, index = divmod(setting, TOTAL_POSITIONS)
+    return ORDERS[order], letters(index // 26**i % 26 for i in range(3))
+
+
+def build_catalog(path, workers=None):
+    from concurrent.futures import ProcessPoolExecutor
+    settings = {}
+    with ProcessPoolExecutor(workers) as executor:
+        for order, structures in enumerate(executor.map(order_structures, ORDERS)):
+            for index, fingerprint in enumerate(structures):
+                settings.setdefault(fmt_fingerprint(fingerprint), []).append(order * TOTAL_POSITIONS + index)
+    return write_catalog(path, settings)
+
+
+def write_catalog(path, settings):
+    # settings maps each catalog_key to its encoded settings. slots hold the key's hash
+    # and where to find the key itself, which lookup compares so a hash collision is
+    # never taken for a match
+    slot_count = 1 << (2 * len(settings)).bit_length()
+    slots = [(0, 0, 0, 0, 0)] * slot_count
+    offset = 0
+    key_offset = 0
+    for key, found in settings.items():
+        h = catalog_hash(key)
+        i = h & (slot_count - 1)
+        while slots[i][4]:
+            i = (i + 1) & (slot_count - 1)
+        slots[i] = (h, key_offset, len(key), offset, len(found))
+        offset += len(found)
+        key_offset += len(key)
+
+    with open(path, 'wb') as f:
+        f.write(CATALOG_HEADER.pack(CATALOG_MAGIC, slot_count, offset))
+        for slot in slots:
+            f.write(CATALOG_SLOT.pack(*slot))
+        for found in settings.values():
+            f.write(struct.pack(f'<{len(found)}I', *found))
+        for key in settings:
+            f.write(key.encode('ascii'))
+    return len(settings)
+
+
+class CycleCatalog:
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.slot_count, self.setting_count = CATALOG_HEADER.unpack_from(self._map)
+        if magic != CATALOG_MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a cycle catalog")
+        self._settings_start = CATALOG_HEADER.size + self.slot_count * CATALOG_SLOT.size
+        self._keys_start = self._settings_start + self.setting_count * CATALOG_SETTING.size
+
+    def lookup(self, fingerprint):
+        key = catalog_key(fingerprint)
+        h = catalog_hash(key)
+        key = key.encode('ascii')
+        i = h & (self.slot_count - 1)
+        while True:
+            slot_hash, key_offset, key_length, offset, count = CATALOG_SLOT.unpack_from(self._map, CATALOG_HEADER.size + i * CATALOG_SLOT.size)
+            if not count:
+                return []
+            key_start = self._keys_start + key_offset
+            if slot_hash == h and self._map[key_start:key_start + key_length] == key:
+                break
+            i = (i + 1) & (self.slot_count - 1)
+        start = self._settings_start + offset * CATALOG_SETTING.size
+        return [decode_setting(s) for s in struct.unpack_from(f'<{count}I', self._map, start)]
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
 # compute_cycles()
 
 
@@ -237,6 +315,8 @@ def get_code(rotor: Rotor):
 
 
 def test():
+    enigma = default_enigma()
+    print(enigma.apply(0))
     for _ in range(50):
         cycles = get_cycle_structure(enigma)
         if len(cycles) >= 6:
@@ -247,4 +327,61 @@ def test():
         enigma.advance()
 
 
-print(enigma.apply(0))
+def main(argv=None):
+    import argparse
+    import cryptoargs
+    from crypto import normalize
+
+    parser = argparse.ArgumentParser(prog='enigma',
+        description='Encrypts and decrypts messages with the Enigma machine, and builds and queries a catalog of indicator cycle fingerprints.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='compute every fingerprint and write the catalog')
+    build_parser.add_argument('catalog', type=str, help='destination for the catalog')
+    build_parser.add_argument('-j', '--jobs', type=int, help='the number of worker processes')
+    query_parser = subparsers.add_parser('query', help='list the settings that produce the given fingerprints')
+    query_parser.add_argument('catalog', type=str, help='a catalog written by build')
+    query_parser.add_argument('fingerprints', nargs='+', type=str, help='cycle lengths in the format 13/12,1/13')
+    process_parser = subparsers.add_parser('process', help='encrypt or decrypt a message with the default rotors; the machine is its own inverse')
+    cryptoargs.add_input(process_parser)
+    process_parser.add_argument('-r', '--order', type=str, default='012', help='the rotor order, fastest first (default 012)')
+    process_parser.add_argument('-p', '--positions', type=str, default='AAA', help='the starting positions of the rotors, fastest first (default AAA)')
+    process_parser.add_argument('-s', '--plugboard', type=str, default='', help='the plugboard in the format AB,CD...')
+    process_parser.add_argument('-j', '--jobs', type=int, help='the number of worker processes for long messages, reading the whole message at once')
+    cryptoargs.add_output(process_parser)
+    args = parser.parse_args(argv)
+
+    if args.command == 'process':
+        machine = default_enigma()
+        positions = args.positions.upper()
+        plugs = [p for p in args.plugboard.upper().split(',') if p]
+        if sorted(args.order) != ['0', '1', '2']:
+            process_parser.error(f"argument -r/--order: {args.order!r} is not an order of the rotors 0, 1 and 2")
+        if len(positions) != 3 or not positions.isalpha() or not positions.isascii():
+            process_parser.error(f"argument -p/--positions: {args.positions!r} is not three letters")
+        if any(len(p) != 2 or not p.isalpha() or not p.isascii() for p in plugs) or len(set(''.join(plugs))) != 2 * len(plugs):
+            process_parser.error(f"argument -s/--plugboard: {args.plugboard!r} is not distinct pairs of letters")
+        machine.set_rotor_order([int(i) for i in args.order])
+        machine.set_trigraph(positions)
+        machine.plugboard = create_plugboard(plugs)
+        if args.jobs is not None:
+            # the whole message at once, so that one pool shares out all of it
+            cryptoargs.write_result(args, machine.process_text(normalize(cryptoargs.get_input(args)).upper(), args.jobs))
+        else:
+            chunks = (normalize(chunk).upper() for chunk in cryptoargs.read_chunks(args))
+            cryptoargs.write_chunks(args, map(machine.process_text, chunks))
+    elif args.command == 'build':
+        print(f"{build_catalog(args.catalog, args.jobs)} fingerprints written to {args.catalog}")
+    else:
+        for fingerprint in args.fingerprints:
+            try:
+                catalog_key(fingerprint)
+            except ValueError:
+                query_parser.error(f"argument fingerprints: {fingerprint!r} is not cycle lengths in the format 13/12,1/13")
+        with CycleCatalog(args.catalog) as catalog:
+            for fingerprint in args.fingerprints:
+                for order, trigraph in catalog.lookup(fingerprint):
+                    print(f"{fingerprint}: {''.join(map(str, order))} {trigraph}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+import instrument
+from enum import IntEnum
+from collections import OrderedDict
+
+
+# texts at least this long are processed by a pool of workers when they are asked for,
+# one window each
+PARALLEL_SIZE = 1 << 20
+WINDOW_SIZE = 1 << 18
+# enough fused inner tables for every position of the slower rotors in one order
+INNER_CACHE_SIZE = 1024
+
+# the machine a pool worker was given, which it seeks to each window in turn
+worker_machine = None
+
+
+class Direction(IntEnum):
+	FORWARD = 0
+	BACKWARD = 1
+
+
+def position_index(positions):
+	# the positions as one number, which advancing one step increments
+	return sum(pos * 26**i for i, pos in enumerate(positions))
+
+
+def index_positions(index, count=3):
+	return tuple(index // 26**i % 26 for i in range(count))
+
+
+def step_positions(positions, offset):
+	# the positions offset steps later: the rotors turn like an odometer, the first
+	# fastest and each carrying into the next as it wraps, so the steps simply add
+	return index_positions(position_index(positions) + offset, len(positions))
+
+
+def padded(table):
+	# bytes.translate needs a full 256-entry table
+	return bytes(table).ljust(256, b'\0')
+
+
+def compile_rotors(rotors, reflector):
+	# the path through rotors and the reflector at every position, without the plugboard,
+	# as one full table per position, in the order advance() visits them from the first
+	tables = [padded(reflector)]
+	for rotor in reversed(rotors):
+		forward = [rotor.table(pos, Direction.FORWARD) for pos in range(26)]
+		backward = [padded(rotor.table(pos, Direction.BACKWARD)) for pos in range(26)]
+		tables = [padded(forward[pos].translate(inner).translate(backward[pos]))
+			for inner in tables for pos in range(26)]
+	return tables
+
+
+def init_worker(machine):
+	global worker_machine
+	worker_machine = machine
+
+
+def process_window(index, text):
+	worker_machine.position_index = index
+	return worker_machine.process_text(text)
+
+
+class RotorMachine:
+	# the rotors, reflector and plugboard that enigma.Enigma and enigmacty.Enigma share,
+	# working on letter codes; each adds its own letters and text processing
+
+	def __init__(self, rotors, reflector):
+		self.plugboard = list(range(26))
+		self._rotors = rotors
+		self.rotor_order = list(rotors)
+		self._inner = None
+		self.reflector = reflector
+
+	def process_windows(self, text, workers, size=WINDOW_SIZE):
+		# every window starts from the positions its offset steps to, so each worker
+		# can seek there directly and the windows join up exactly as one serial run.
+		# the machine is sent to each worker once, rather than with every window
+		from concurrent.futures import ProcessPoolExecutor
+		start = self.position_index
+		bounds = range(0, len(text), size)
+		with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(self,)) as executor:
+			result = ''.join(executor.map(process_window, (start + i for i in bounds), (text[i:i + size] for i in bounds)))
+		self.advance(len(text))
+		return result
+
+	def process(self, seq):
+		for a in seq:
+			yield self.apply(a)
+			self.step()
+
+	def apply(self, a):
+		fast, *slow = self.rotor_order
+		positions = [rotor.pos for rotor in slow]
+		if positions != self._inner_positions:
+			self._inner = self.inner_table(slow, positions)
+			self._inner_positions = positions
+		a = self._inner[fast.forward(self.plugboard[a])]
+		return self.plugboard[fast.backward(a)]
+
+	def inner_table(self, rotors, positions):
+		# the path through rotors at positions, the reflector and back again, as one table.
+		# apply() passes every rotor but the first, and they only move when it turns over,
+		# so recent tables are kept, dropping the least recently used
+		key = (tuple(self.reflector), *rotors, *positions)
+		table = self._inner_tables.get(key)
+		if table is None:
+			table = self._inner_tables[key] = self._build_inner_table(rotors, positions)
+			if len(self._inner_tables) > INNER_CACHE_SIZE:
+				self._inner_tables.popitem(last=False)
+		else:
+			self._inner_tables.move_to_end(key)
+		return table
+
+	@instrument.measured('enigmacore.RotorMachine._build_inner_table')
+	def _build_inner_table(self, rotors, positions):
+		table = bytes(self.reflector)
+		for rotor, pos in zip(reversed(rotors), reversed(positions)):
+			table = rotor.table(pos, Direction.FORWARD).translate(padded(table)).translate(padded(rotor.table(pos, Direction.BACKWARD)))
+		return table
+
+	def step(self):
+		for rotor in self.rotor_order:
+			complete_revolution = rotor.rotate()
+			if not complete_revolution:
+				break
+
+	def advance(self, amount=1):
+		self.position_index += amount
+
+	def permutation(self, order=None, positions=None, offset=0):
+		# the letter each letter becomes offset steps after positions, with the rotors in
+		# order (by default the machine's own), as a bytes of codes; the machine is unchanged
+		fast, *slow = self.rotor_order if order is None else [self._rotors[i] for i in order]
+		pos, *positions = step_positions(self.positions if positions is None else positions, offset)
+		table = bytes(self.plugboard).translate(padded(fast.table(pos, Direction.FORWARD)))
+		table = table.translate(padded(self.inner_table(slow, positions)))
+		return table.translate(padded(fast.table(pos, Direction.BACKWARD))).translate(padded(self.plugboard))
+
+	def set_rotor_order(self, order):
+		self.rotor_order = [self._rotors[i] for i in order]
+		self.clear_tables()
+
+	@property
+	def reflector(self):
+		return self._reflector
+
+	@reflector.setter
+	def reflector(self, reflector):
+		self._reflector = reflector
+		self.clear_tables()
+
+	def clear_tables(self):
+		# the fused tables are only good for the rotor order and reflector they were built with
+		self._inner_tables = OrderedDict()
+		self._inner_positions = None
+
+	def set_positions(self, positions):
+		for rotor, pos in zip(self.rotor_order, positions):
+			rotor.set_position(pos)
+
+	@property
+	def positions(self):
+		return tuple(r.pos for r in self.rotor_order)
+
+	@property
+	def position_index(self):
+		return position_index(self.positions)
+
+	@position_index.setter
+	def position_index(self, index):
+		self.set_positions(index_positions(index, len(self.rotor_order)))
@@ -1,17 +1,15 @@
-from enum import IntEnum
+import itertools
+import operator
+import instrument
 from typing import Iterable
-from crypto import acode, OFFSET_UPPER
+from enigmacore import Direction, RotorMachine, compile_rotors, padded, PARALLEL_SIZE
+from crypto import acode, use_pool, ALPHABET, OFFSET_UPPER
 
 
 def letter(a):
 	return chr(OFFSET_UPPER + a)
 
 
-class Direction(IntEnum):
-	FORWARD = 0
-	BACKWARD = 1
-
-
 class Rotor:
 
 	def __init__(self, offsets: list[int], name):
@@ -34,8 +32,13 @@ class Rotor:
 	def backward(self, a):
 		return self._apply(a, Direction.BACKWARD)
 
-	def _apply(self, a, direction: Direction):
-		return (a + self.wiring[(a - self.pos) % 26][direction]) % 26
+	def _apply(self, a, direction: Direction, pos=None):
+		if pos is None:
+			pos = self.pos
+		return (a + self.wiring[(a - pos) % 26][direction]) % 26
+
+	def table(self, pos, direction: Direction):
+		return bytes(self._apply(a, direction, pos) for a in range(26))
 
 	def rotate(self):
 		self.pos = (self.pos + 1) % 26
@@ -54,7 +57,7 @@ def _check_alpha(table):
 		missing = ''.join(letter(a) for a in sorted(set(range(26)) - unique))
 		raise ValueError(f"Rotor was missing letters: {missing}")
 	if len(table) != 26:
-		raise ValueError(f"Rotor had invalid length {len(alpha)}")
+		raise ValueError(f"Rotor had invalid length {len(table)}")
 
 
 def create_plugboard(plugs: Iterable[Iterable[str]]):
@@ -86,44 +89,44 @@ def create_rotor(alpha, name=None):
 	return
 
 
-class Enigma:
-	def __init__(self, rotors: list[Rotor], reflector):
-		self.plugboard = create_plugboard([])
-		self._rotors = rotors
-		self.rotor_order = list(rotors)
-		self.reflector = reflector
-
-	def process_text(self, text):
+class Enigma(RotorMachine):
+	def __init__(self, rotors: list[Rotor], reflector, compiled=False):
+		super().__init__(rotors, reflector)
+		self.compiled = compiled
+		self._compiled_tables = {}
+
+	@instrument.measured('enigmacty.Enigma.process_text', len)
+	def process_text(self, text, workers=None):
+		if use_pool(text, workers, PARALLEL_SIZE):
+			if self.compiled:
+				# sent along with the machine, which is cheaper than each worker compiling it
+				self.compiled_table()
+			return self.process_windows(text, workers)
+		if self.compiled and text.isascii() and text.isalpha():
+			return self._process_compiled(text)
 		return ''.join(letter(a) for a in self.process(acode(c) for c in text))
 
-	def process(self, seq):
-		for a in seq:
-			yield self.apply(a)
-			self.advance()
-
-	def apply(self, a):
-		a = self.plugboard[a]
-		for rotor in self.rotor_order:
-			a = rotor.forward(a)
-		a = self.reflector[a]
-		for rotor in reversed(self.rotor_order):
-			a = rotor.backward(a)
-		a = self.plugboard[a]
-		return a
-
-	def advance(self, amount=1):
-		for _ in range(amount):
-			for rotor in self.rotor_order:
-				complete_revolution = rotor.rotate()
-				if not complete_revolution:
-					break
-
-	def set_rotor_order(self, order):
-		self.rotor_order = [self._rotors[i] for i in order]
-
-	def set_positions(self, positions):
-		for rotor, pos in zip(self.rotor_order, positions):
-			rotor.set_position(pos)
+	def compiled_table(self):
+		key = (tuple(self.reflector), *self.rotor_order)
+		table = self._compiled_tables.get(key)
+		if table is None:
+			table = self._compiled_tables[key] = self._build_compiled_table()
+		return table
+
+	@instrument.measured('enigmacty.Enigma._build_compiled_table')
+	def _build_compiled_table(self):
+		# 26 bytes per position, so 26**4 bytes for three rotors
+		return b''.join(t[:26] for t in compile_rotors(self.rotor_order, self.reflector))
+
+	def _process_compiled(self, text):
+		table = self.compiled_table()
+		plugboard = padded(self.plugboard)
+		start = self.position_index
+		codes = ALPHABET.encode_all(text).translate(plugboard)
+		offsets = itertools.islice(itertools.cycle(range(0, len(table), 26)), start, start + len(codes))
+		result = bytes(map(table.__getitem__, map(operator.add, offsets, codes)))
+		self.position_index = start + len(codes)
+		return ALPHABET.decode_all(result.translate(plugboard))
 
 	def set_trigraph(self, tri):
 		self.set_positions([acode(a) for a in tri])
@@ -132,14 +135,11 @@ class Enigma:
 	def trigraph(self):
 		return ''.join(letter(r.pos) for r in self.rotor_order)
 
-	@property
-	def positions(self):
-		return tuple(r.pos for r in self.rotor_order)
-
-
-r1 = Rotor.from_str('Enigma I-1', 'EKMFLGDQVZNTOWYHXUSPAIBRCJ')
-r2 = Rotor.from_str('Enigma I-2', 'AJDKSIRUXBLHWTMCQGZNPYFVOE')
-r3 = Rotor.from_str('Enigma I-3', 'BDFHJLCPRTXVZNYEIWGAKMUSQO')
-ref = create_reflector('YRUHQSLDPXNGOKMIEBFZCWVJAT')
 
-enigma = Enigma([r1, r2, r3], ref)
+def default_enigma():
+	# a new machine each call, so that callers can set it up independently
+	r1 = Rotor.from_str('EKMFLGDQVZNTOWYHXUSPAIBRCJ', 'Enigma I-1')
+	r2 = Rotor.from_str('AJDKSIRUXBLHWTMCQGZNPYFVOE', 'Enigma I-2')
+	r3 = Rotor.from_str('BDFHJLCPRTXVZNYEIWGAKMUSQO', 'Enigma I-3')
+	ref = create_reflector('YRUHQSLDPXNGOKMIEBFZCWVJAT')
+	return Enigma([r1, r2, r3], ref)
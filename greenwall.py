@@ -1,50 +1,114 @@
+import math
 import itertools
-from string import ascii_uppercase
-from crypto import chunks, join_result, create_trans, acode as base_acode, OFFSET_UPPER
+import instrument
+from functools import lru_cache
+from crypto import join_result, normalize, StandardAlphabet
 
 
-MULT_INV = [None] + [pow(i, -1, 29) for i in range(1, 29)]
 PUNCT = ' ,.'
-ALPHA = ascii_uppercase + PUNCT
-punct_codes = {c: i for i, c in enumerate(PUNCT, start=26)}
+# the multipliers are inverted modulo the size of the alphabet, which must be prime
+ALPHABET = StandardAlphabet(PUNCT)
 
 
-def acode(c):
-	# could be improved with full ascii lookup table
-	# as is, we start with a map lookup that misses most of the time
-	if a := punct_codes.get(c):
-		return a
-	return base_acode(c)
+@lru_cache(maxsize=16)
+def inverses(n):
+	return [None] + [pow(i, -1, n) for i in range(1, n)]
 
-def acodes(s, start=0):
-	return [acode(c) + start for c in s]
 
-def enc_func(a, h, v, b):
-	return ((b * a + h) * v) % 29
+def acodes(s, alphabet, start=0):
+	return [alphabet.encode(c) + start for c in s]
 
-def dec_func(a, h, v, b):
-	return ((MULT_INV[v] * a - h) * MULT_INV[b]) % 29
+def key_cells(key_horiz, key_vert, alphabet):
+	# every (vertical, horizontal) pair of key codes, in the order the message uses them
+	n = alphabet.size
+	if n < 2 or any(n % p == 0 for p in range(2, math.isqrt(n) + 1)):
+		raise ValueError(f"the alphabet size must be prime but {alphabet.letters!r} has {n} symbols")
+	if not key_horiz or not key_vert:
+		raise ValueError("the horizontal and vertical keys must each contain at least one letter")
+	vert = acodes(key_vert, alphabet, 1)
+	if n in vert:
+		# its multiplier would be n, which is 0 and has no inverse
+		raise ValueError(f"the vertical key cannot use the last symbol of the alphabet, {alphabet.letters[-1]!r}")
+	return list(itertools.product(vert, acodes(key_horiz, alphabet)))
 
+def enc_func(a, h, v, b, n):
+	return ((b * a + h) * v) % n
 
-@join_result
-def greenwall(message, key_horiz, key_vert, func):
-	horiz = acodes(key_horiz)
-	vert = acodes(key_vert, 1)
-	code = acodes(message)
-	for block_num, chunk in enumerate(chunks(code, len(horiz) * len(vert))):
-		for a, (v, h) in zip(chunk, itertools.product(vert, horiz)):
-			# use variable offset rather than explicit .lower()?
-			yield ALPHA[func(a, h, v, block_num % 28 + 1)]
-
-
-def encrypt(message, key_horiz, key_vert):
-	return greenwall(message, key_horiz, key_vert, enc_func)
+def dec_func(a, h, v, b, n):
+	inv = inverses(n)
+	return ((inv[v] * a - h) * inv[b]) % n
 
-def decrypt(message, key_horiz, key_vert):
-	return greenwall(message, key_horiz, key_vert, dec_func).lower()
 
-
-if __name__ == '__main__':
+@join_result
+def greenwall(message, key_horiz, key_vert, func, start=0, alphabet=ALPHABET):
+	# start is the position of the message within a longer stream
+	n = alphabet.size
+	keys = key_cells(key_horiz, key_vert, alphabet)
+	for i, a in enumerate(acodes(message, alphabet), start):
+		v, h = keys[i % len(keys)]
+		# use variable offset rather than explicit .lower()?
+		yield alphabet.decode(func(a, h, v, i // len(keys) % (n - 1) + 1, n))
+
+
+# each table serves one stride of the period, so the bulk path only pays off once
+# the strides are this many letters long
+BULK_STRIDE = 32
+
+
+@lru_cache(maxsize=4096)
+def code_table(h, v, b, func, alphabet):
+	# the whole transform for one key cell and block multiplier, from byte to result letter.
+	# it is affine in the code, so it repeats every size codes, and only one period of it
+	# need be computed before the codes are translated through it
+	n = alphabet.size
+	symbols = bytes(alphabet.upper[func(a, h, v, b, n)] for a in range(n))
+	return alphabet.codes.translate((symbols * (256 // n + 1))[:256])
+
+
+@instrument.measured('greenwall.greenwall_bulk', len)
+def greenwall_bulk(message, key_horiz, key_vert, func, start=0, alphabet=ALPHABET):
+	keys = key_cells(key_horiz, key_vert, alphabet)
+	try:
+		data = message.encode('latin-1')
+	except UnicodeEncodeError:
+		return greenwall(message, key_horiz, key_vert, func, start, alphabet)
+	alphabet.check(data)
+	# the key cell and the block multiplier repeat together every period letters,
+	# so each stride of that period goes through a single table
+	blocks = alphabet.size - 1
+	period = len(keys) * blocks
+	if len(data) < period * BULK_STRIDE:
+		return greenwall(message, key_horiz, key_vert, func, start, alphabet)
+	result = bytearray(len(data))
+	for j in range(min(period, len(data))):
+		i = start + j
+		v, h = keys[i % len(keys)]
+		result[j::period] = data[j::period].translate(code_table(h, v, i // len(keys) % blocks + 1, func, alphabet))
+	return result.decode('latin-1')
+
+
+def greenwall_stream(chunks, key_horiz, key_vert, func, alphabet=ALPHABET):
+	key_cells(key_horiz, key_vert, alphabet)
+	start = 0
+	for chunk in chunks:
+		yield greenwall_bulk(chunk, key_horiz, key_vert, func, start, alphabet)
+		start += len(chunk)
+
+
+def encrypt(message, key_horiz, key_vert, alphabet=ALPHABET):
+	return greenwall_bulk(message, key_horiz, key_vert, enc_func, alphabet=alphabet)
+
+def decrypt(message, key_horiz, key_vert, alphabet=ALPHABET):
+	return greenwall_bulk(message, key_horiz, key_vert, dec_func, alphabet=alphabet).lower()
+
+def encrypt_stream(chunks, key_horiz, key_vert, alphabet=ALPHABET):
+	return greenwall_stream(chunks, key_horiz, key_vert, enc_func, alphabet)
+
+def decrypt_stream(chunks, key_horiz, key_vert, alphabet=ALPHABET):
+	return (result.lower() for result in greenwall_stream(chunks, key_horiz, key_vert, dec_func, alphabet))
+
+
+def main(argv=None):
 	import argparse
 	import cryptoargs
 	
@@ -57,12 +121,22 @@ if __name__ == '__main__':
 	parser.add_argument('-v', '--vertical',   type=str, required=True, metavar='VERT',  help='the vertical (multiplicative) keyword')
 	cryptoargs.add_mode(parser)
 	cryptoargs.add_output(parser)
-	args = parser.parse_args()
-
-	trans = create_trans(' ,.')
-	message = cryptoargs.get_input(args).translate(trans)
-	mode = cryptoargs.get_mode(args, encrypt, decrypt)
+	args = parser.parse_args(argv)
+	key_horiz = normalize(args.horizontal, PUNCT)
+	key_vert = normalize(args.vertical, PUNCT)
+	try:
+		key_cells(key_horiz, key_vert, ALPHABET)
+	except ValueError as e:
+		parser.error(f"arguments -z/--horizontal, -v/--vertical: {e}")
+
+	chunks = (normalize(chunk, PUNCT) for chunk in cryptoargs.read_chunks(args))
+	mode = cryptoargs.get_mode(args, encrypt_stream, decrypt_stream)
 	if mode is None:
-		mode = encrypt if cryptoargs.probe_text(message) else decrypt
+		plaintext, chunks = cryptoargs.probe_chunks(chunks)
+		mode = encrypt_stream if plaintext else decrypt_stream
+
+	cryptoargs.write_chunks(args, mode(chunks, key_horiz, key_vert))
 
-	cryptoargs.write_result(args, mode(message, args.horizontal, args.vertical))
+
+if __name__ == '__main__':
+	main()
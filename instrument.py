@@ -0,0 +1,120 @@
+import os
+import sys
+import atexit
+import functools
+from time import perf_counter
+
+
+# setting this to a file name turns instrumentation on and writes a snapshot there at exit
+ENV_VAR = 'CRYPTO_INSTRUMENT'
+# latency buckets are powers of two in microseconds: bucket n holds calls under 2**n us
+BUCKETS = 32
+
+enabled = False
+stats = {}
+
+
+class Stat:
+	__slots__ = ('calls', 'chars', 'seconds', 'histogram')
+
+	def __init__(self):
+		self.calls = 0
+		self.chars = 0
+		self.seconds = 0.0
+		self.histogram = [0] * BUCKETS
+
+	def add(self, seconds, chars):
+		self.calls += 1
+		self.chars += chars
+		self.seconds += seconds
+		self.histogram[min(int(seconds * 1e6).bit_length(), BUCKETS - 1)] += 1
+
+	def as_dict(self):
+		return {
+			'calls': self.calls,
+			'chars': self.chars,
+			'seconds': self.seconds,
+			'mean_latency': self.seconds / self.calls if self.calls else 0.0,
+			'chars_per_second': self.chars / self.seconds if self.seconds else 0.0,
+			# trailing empty buckets are dropped; the upper bound of each is in microseconds
+			'histogram': {f"<{1 << n}us": count for n, count in enumerate(self.histogram) if count},
+		}
+
+
+def enable():
+	global enabled
+	enabled = True
+
+def disable():
+	global enabled
+	enabled = False
+
+def reset():
+	stats.clear()
+
+
+def record(name, seconds, chars=0):
+	stat = stats.get(name)
+	if stat is None:
+		stat = stats[name] = Stat()
+	stat.add(seconds, chars)
+
+
+def measured(name, count=None):
+	# times every call while enabled; count gives the characters a result stands for
+	def decorator(func):
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			if not enabled:
+				return func(*args, **kwargs)
+			start = perf_counter()
+			result = func(*args, **kwargs)
+			record(name, perf_counter() - start, count(result) if count is not None else 0)
+			return result
+		return wrapper
+	return decorator
+
+
+def snapshot():
+	return {name: stat.as_dict() for name, stat in sorted(stats.items())}
+
+
+def dump(path=None):
+	import json
+	text = json.dumps(snapshot(), indent=1)
+	if path is None or path == '-':
+		print(text, file=sys.stderr)
+	else:
+		with open(path, 'w') as f:
+			f.write(text + '\n')
+
+
+def capture(func, profile=None, memory=False):
+	# runs func once under cProfile (saved to profile) and/or tracemalloc (peak and top
+	# allocations reported on stderr)
+	profiler = None
+	if profile is not None:
+		import cProfile
+		profiler = cProfile.Profile()
+	if memory:
+		import tracemalloc
+		tracemalloc.start()
+	try:
+		if profiler is not None:
+			return profiler.runcall(func)
+		return func()
+	finally:
+		if profiler is not None:
+			profiler.dump_stats(profile)
+		if memory:
+			memory_snapshot = tracemalloc.take_snapshot()
+			_, peak = tracemalloc.get_traced_memory()
+			tracemalloc.stop()
+			print(f"peak traced memory: {peak / 1024:.1f} KiB", file=sys.stderr)
+			for stat in memory_snapshot.statistics('lineno')[:10]:
+				print(stat, file=sys.stderr)
+
+
+if os.environ.get(ENV_VAR):
+	enable()
+	atexit.register(dump, os.environ[ENV_VAR])
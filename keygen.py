@@ -1,6 +1,8 @@
+import os
 import sys
 import secrets
 import string
+from array import array
 from string import ascii_uppercase as ALPHA
 
 def exclude(letter):
@@ -14,20 +16,64 @@ ALPHABETS = {
 	'36': ALPHA + string.digits,
 }
 
+CHUNK_SIZE = 1 << 20
+GRID_BATCH = 1024
+
 def generate(alphabet, length):
 	for _ in range(length):
 		yield secrets.choice(alphabet)
 
 
-if __name__ == '__main__':
+def sample_table(alphabet):
+	# maps every random byte below the largest multiple of len(alphabet) to a letter,
+	# and lists the bytes above it, which must be dropped to avoid bias
+	data = alphabet.encode('latin-1')
+	limit = 256 - 256 % len(data)
+	return (data * (256 // len(data)))[:limit].ljust(256, b'\0'), bytes(range(limit, 256))
+
+
+def generate_bulk(alphabet, length, size=CHUNK_SIZE):
+	# yields the key in chunks of size letters, rejection-sampling os.urandom buffers
+	try:
+		table, rejected = sample_table(alphabet)
+		# draw a little more than the expected need so that one buffer usually fills a chunk
+		draw = 256 / (256 - len(rejected)) * 1.01
+	except (UnicodeEncodeError, ZeroDivisionError):
+		while length > 0:
+			need = min(size, length)
+			length -= need
+			yield ''.join(generate(alphabet, need))
+		return
+	while length > 0:
+		need = min(size, length)
+		chunk = b''
+		while len(chunk) < need:
+			chunk += os.urandom(int((need - len(chunk)) * draw) + 64).translate(table, rejected)
+		length -= need
+		yield chunk[:need].decode('latin-1')
+
+
+def grids(alphabet, count):
+	# random permutations of alphabet, each ordered by a random 64-bit key per letter
+	# (a tie, which would favour the original order, has odds around 2 ** -55)
+	while count > 0:
+		batch = min(count, GRID_BATCH)
+		keys = array('Q', os.urandom(8 * len(alphabet) * batch))
+		for i in range(0, len(keys), len(alphabet)):
+			yield ''.join(c for _, c in sorted(zip(keys[i:i + len(alphabet)], alphabet)))
+		count -= batch
+
+
+def main(argv=None):
 	import argparse
 
 	parser = argparse.ArgumentParser(prog='random',
 		description='Generates random keys for classical ciphers.')
 	parser.add_argument('-a', '--alpha', metavar='ALPHABET', type=str, default=ALPHA, help='the alphabet of the key')
+	parser.add_argument('-g', '--grids', action='store_true', help='output LENGTH random orderings of the alphabet (grids for Playfair or ADFGVX), one per line')
 	parser.add_argument('length', type=int, help='the length of the key')
 	parser.add_argument('out_file', type=str, nargs='?', metavar='out_file', help='destination for output')
-	args = parser.parse_args()
+	args = parser.parse_args(argv)
 
 	length = args.length
 	if len(args.alpha) < 4:
@@ -37,10 +83,20 @@ if __name__ == '__main__':
 	else:
 		alphabet = args.alpha
 
-	result = ''.join(generate(alphabet, length))
-	
+	if args.grids:
+		result = (grid + '\n' for grid in grids(alphabet, length))
+	else:
+		result = generate_bulk(alphabet, length)
+
 	if args.out_file is not None:
 		with open(args.out_file, 'w') as f:
-			f.write(result)
+			f.writelines(result)
 	else:
-		print(result)
+		for chunk in result:
+			print(chunk, end='')
+		if not args.grids:
+			print()
+
+
+if __name__ == '__main__':
+	main()
@@ -1,24 +1,75 @@
+import os
+import sys
+import math
+import time
+import random
+import instrument
+from array import array
+from functools import lru_cache
 from string import ascii_uppercase
-from crypto import fill, grid_lookup, acode, chunks_iter, normalize
+from crypto import fill, grid_lookup, recase, chunks_iter, normalize, Quadgrams, ALPHABET
 
 
 ALPHA = ascii_uppercase.replace('J', '')
 
 
+def pad(c):
+	return 'X' if c.upper() != 'X' else 'Q'
+
+
+# the cell code of any byte that is not in the grid
+INVALID = 0xFF
+# a pair of cells is indexed by its two numbers read as one native 16-bit integer, as
+# array('H') sees them; the largest number is 24
+CELL_PAIRS = 24 * 257 + 1
+
+
+@lru_cache(maxsize=8)
+@instrument.measured('playfair.cell_pairs_table')
+def cell_pairs_table(shift=1):
+	# the pair of cells every pair of cells encrypts to with shift; the same for every grid
+	table = [0] * CELL_PAIRS
+	for i in range(25):
+		for j in range(25):
+			(r1, c1), (r2, c2) = divmod(i, 5), divmod(j, 5)
+			if r1 == r2:
+				cells = (r1 * 5 + (c1 + shift) % 5, r2 * 5 + (c2 + shift) % 5)
+			elif c1 == c2:
+				cells = ((r1 + shift) % 5 * 5 + c1, (r2 + shift) % 5 * 5 + c2)
+			else:
+				cells = (r1 * 5 + c2, r2 * 5 + c1)
+			table[int.from_bytes(bytes((i, j)), sys.byteorder)] = int.from_bytes(bytes(cells), sys.byteorder)
+	return table
+
+
 class Playfair:
 
-	def __init__(self, grid):
+	def __init__(self, grid, alphabet=ALPHABET):
+		# the grid may hold any 25 symbols of the alphabet
 		self.grid = grid
-		self.lookup = grid_lookup(grid, 26)
+		self.alphabet = alphabet
+		self.lookup = grid_lookup(grid, alphabet.size, alphabet.encode)
+		# the cell of every byte, in either case, and the letter in every cell, as translate tables
+		letters = ''.join(c for row in grid for c in row)
+		cells = bytearray([INVALID]) * 256
+		for i, c in enumerate(letters):
+			cells[ord(recase(c, str.upper))] = i
+			cells[ord(recase(c, str.lower))] = i
+		if cells[ord('J')] == INVALID and cells[ord('I')] != INVALID:
+			# J shares a cell with I, as in the keyword
+			cells[ord('J')] = cells[ord('j')] = cells[ord('I')]
+		self.cells = bytes(cells)
+		self.symbols = bytes(i for i, a in enumerate(cells) if a != INVALID)
+		self.letters = letters.encode('latin-1').ljust(256, b'\0')
 
 	@classmethod
 	def from_keyword(cls, keyword):
-		keyword = keyword.upper().replace('I', 'J')
+		keyword = keyword.upper().replace('J', 'I')
 		return cls(list(chunks_iter(fill(keyword, ALPHA), 5)))
 
 	def encrypt_pair(self, c1, c2, shift=1):
-		row1, col1 = self.lookup[acode(c1)]
-		row2, col2 = self.lookup[acode(c2)]
+		row1, col1 = self.lookup[self.alphabet.encode(c1)]
+		row2, col2 = self.lookup[self.alphabet.encode(c2)]
 		if row1 == row2:
 			return (self.grid[row1][(col1 + shift) % 5], 
 			        self.grid[row1][(col2 + shift) % 5])
@@ -26,45 +77,184 @@ class Playfair:
 			return (self.grid[(row1 + shift) % 5][col1], 
 			        self.grid[(row2 + shift) % 5][col1])
 		return self.grid[row1][col2], self.grid[row2][col1]
+
+	def pad_cell(self, cell):
+		letter = pad(chr(self.letters[cell]))
+		pad_cell = self.cells[ord(letter)]
+		if pad_cell == INVALID:
+			raise ValueError(f"the grid has no {letter!r} to pad with")
+		return bytes((pad_cell,))
+
+	def digraphs(self, message, final=True):
+		# the cells of the message with pads inserted, so that it splits evenly into pairs
+		# of different cells; unless final, a lone last letter is returned as pending instead
+		data = message.encode('latin-1')
+		cells = data.translate(self.cells)
+		if INVALID in cells:
+			missing = data.translate(None, self.symbols).decode('latin-1')
+			raise ValueError(f"{''.join(sorted(set(missing)))!r} not in the grid")
+		length = len(cells) - 1
+		diff = int.from_bytes(cells[:-1], 'big') ^ int.from_bytes(cells[1:], 'big')
+		doubles = diff.to_bytes(max(length, 0), 'big')
+		pieces = []
+		start = 0
+		while True:
+			# only a double that starts a pair needs padding
+			i = doubles.find(0, start)
+			while i != -1 and (i - start) % 2:
+				i = doubles.find(0, i + 1)
+			if i == -1:
+				break
+			pieces.append(cells[start:i + 1])
+			pieces.append(self.pad_cell(cells[i]))
+			start = i + 1
+		pieces.append(cells[start:])
+		padded = b''.join(pieces)
+
+		pending = ''
+		if len(padded) % 2:
+			if final:
+				padded += self.pad_cell(padded[-1])
+			else:
+				pending = message[-1]
+				padded = padded[:-1]
+		return padded, pending
 	
 	def encrypt(self, message, shift=1):
-		result = []
-		i = 0
-		while i < len(message):
-			c1 = message[i]
-			i += 1
-			c2 = message[i] if i < len(message) else 'X'
-
-			if c1 == c2:
-				c2 = 'X' if c1 != 'X' else 'Q'	
-			else:
-				i += 1
+		return self._encrypt(message, shift)[0]
 
-			result.extend(self.encrypt_pair(c1, c2, shift))
-
-		return ''.join(result)
+	@instrument.measured('playfair.Playfair._encrypt', lambda result: len(result[0]))
+	def _encrypt(self, message, shift=1, final=True):
+		padded, pending = self.digraphs(message, final)
+		pairs = array('H', padded)
+		result = array('H', map(cell_pairs_table(shift).__getitem__, pairs))
+		return result.tobytes().translate(self.letters).decode('latin-1'), pending
 
 	def decrypt(self, message):
 		return self.encrypt(message, -1).lower()
 
+	def encrypt_stream(self, chunks, shift=1):
+		pending = ''
+		for chunk in chunks:
+			result, pending = self._encrypt(pending + chunk, shift, final=False)
+			yield result
+		yield self.encrypt(pending, shift)
 
-if __name__ == '__main__':
+	def decrypt_stream(self, chunks):
+		return (result.lower() for result in self.encrypt_stream(chunks, -1))
+
+
+DEFAULT_BUDGET = 60
+# annealing schedule: the temperature starts in proportion to the message length
+# and falls linearly to zero over each restart
+TEMPERATURE_PER_LETTER = 0.09
+RESTART_STEPS = 300_000
+
+
+def decrypt_cells(grid, cipher):
+	# grid is bytes of the letter code in each cell; cipher is bytes of letter codes
+	cells = bytearray(256)
+	for i, a in enumerate(grid):
+		cells[a] = i
+	pairs = array('H', cipher.translate(cells))
+	return array('H', map(cell_pairs_table(-1).__getitem__, pairs)).tobytes().translate(grid.ljust(256, b'\0'))
+
+
+def mutate(grid, rng):
+	grid = bytearray(grid)
+	move = rng.random()
+	if move < 0.9:
+		i, j = rng.sample(range(25), 2)
+		grid[i], grid[j] = grid[j], grid[i]
+	elif move < 0.95:
+		i, j = rng.sample(range(5), 2)
+		grid[i * 5:i * 5 + 5], grid[j * 5:j * 5 + 5] = grid[j * 5:j * 5 + 5], grid[i * 5:i * 5 + 5]
+	elif move < 0.99:
+		i, j = rng.sample(range(5), 2)
+		grid[i::5], grid[j::5] = grid[j::5], grid[i::5]
+	else:
+		grid = [grid[c * 5 + r] for r in range(5) for c in range(5)]
+	return bytes(grid)
+
+
+def anneal(cipher, alphabet, fitness, deadline, seed):
+	# restarts until the deadline, keeping the best grid seen
+	rng = random.Random(seed)
+	best, best_score = None, -math.inf
+	while time.monotonic() < deadline:
+		grid = bytes(rng.sample(alphabet, 25))
+		current = fitness.score(decrypt_cells(grid, cipher))
+		if current > best_score:
+			best, best_score = grid, current
+		start_temperature = TEMPERATURE_PER_LETTER * len(cipher)
+		for step in range(RESTART_STEPS, 0, -1):
+			if not step % 1000 and time.monotonic() >= deadline:
+				break
+			candidate = mutate(grid, rng)
+			candidate_score = fitness.score(decrypt_cells(candidate, cipher))
+			delta = candidate_score - current
+			if delta >= 0 or rng.random() < math.exp(delta / (start_temperature * step / RESTART_STEPS)):
+				grid, current = candidate, candidate_score
+				if current > best_score:
+					best, best_score = grid, current
+	return best_score, best
+
+
+def crack(ciphertext, fitness, budget=DEFAULT_BUDGET, workers=None):
+	# returns the best grid as a from_keyword string, and its score
+	from concurrent.futures import ProcessPoolExecutor
+	ciphertext = normalize(ciphertext).upper().replace('J', 'I')
+	if len(ciphertext) % 2:
+		raise ValueError("Playfair ciphertext must have an even number of letters")
+	alphabet = list(ALPHABET.encode_all(ALPHA))
+	cipher = ALPHABET.encode_all(ciphertext)
+	workers = workers or os.cpu_count()
+	deadline = time.monotonic() + budget
+	with ProcessPoolExecutor(workers) as executor:
+		futures = [executor.submit(anneal, cipher, alphabet, fitness, deadline, seed) for seed in range(workers)]
+		found = [f.result() for f in futures if f.result()[1] is not None]
+	if not found:
+		raise ValueError(f"no grid was tried within the time budget of {budget} seconds")
+	best_score, best = max(found)
+	return ALPHABET.decode_all(best), best_score
+
+
+def main(argv=None):
 	import argparse
 	import cryptoargs
 
 	parser = argparse.ArgumentParser(prog='playfair',
 		description='Applies the Playfair Cipher to a message. ' + cryptoargs.MODE_INSTRUCTIONS)
 	cryptoargs.add_input(parser)
-	parser.add_argument('-k', '--key', type=str, required=True, help='the key (in one line), or a keyword')
+	key_group = parser.add_mutually_exclusive_group(required=True)
+	key_group.add_argument('-k', '--key', type=str, help='the key (in one line), or a keyword')
+	key_group.add_argument('-s', '--solve', type=str, metavar='QUADGRAMS', help='recover an unknown key, scoring candidates against a quadgram table (or the English text to build one from), report it and decrypt')
 	# TODO: keyfile
+	parser.add_argument('-t', '--time', type=float, default=DEFAULT_BUDGET, metavar='SECONDS', help=f'time budget for --solve (default {DEFAULT_BUDGET})')
 	cryptoargs.add_mode(parser)
 	cryptoargs.add_output(parser)
-	args = parser.parse_args()
+	args = parser.parse_args(argv)
+
+	if args.solve is not None:
+		fitness = Quadgrams.open(args.solve)
+		message = normalize(cryptoargs.get_input(args))
+		try:
+			key, _ = crack(message, fitness, args.time)
+		except ValueError as e:
+			parser.error(f"argument message: {e}")
+		print(f"key: {key}", file=sys.stderr)
+		cryptoargs.write_result(args, Playfair.from_keyword(key).decrypt(message.upper().replace('J', 'I')))
+		sys.exit()
 
-	message = normalize(cryptoargs.get_input(args))
+	chunks = map(normalize, cryptoargs.read_chunks(args))
 	pf = Playfair.from_keyword(normalize(args.key))
-	mode = cryptoargs.get_mode(args, pf.encrypt, pf.decrypt)
+	mode = cryptoargs.get_mode(args, pf.encrypt_stream, pf.decrypt_stream)
 	if mode is None:
-		mode = pf.encrypt if message[0].islower() else pf.decrypt
+		plaintext, chunks = cryptoargs.probe_chunks(chunks)
+		mode = pf.encrypt_stream if plaintext else pf.decrypt_stream
 
-	cryptoargs.write_result(args, mode(message))
+	cryptoargs.write_chunks(args, mode(chunks))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,9 @@
+import pathlib
+import pytest
+
+ENGLISH = pathlib.Path(__file__).with_name('english.txt')
+
+
+@pytest.fixture(scope='session')
+def english():
+	return ENGLISH.read_text()
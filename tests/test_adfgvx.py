@@ -0,0 +1,100 @@
+import random
+import pytest
+import adfgvx
+from crypto import Quadgrams, normalize
+
+
+GRID36 = 'PH0QG64MEA1YL2NOFDXKR3CVS5ZW7BJ9UTI8'
+
+
+def reference_columnar(data, word):
+	# the columns sorted by their keyword letter, ties in order, each read top to bottom
+	width = len(word)
+	columns = sorted(range(width), key=lambda c: (word[c], c))
+	return bytes(data[r * width + c] for c in columns for r in range(len(data) // width))
+
+
+@pytest.mark.parametrize('word', ['CARGO', 'GERMAN', 'BALLOON', 'ZZAZ', 'A'])
+def test_columnar(word):
+	rng = random.Random(word)
+	data = bytes(rng.choice(b'ADFGVX') for _ in range(len(word) * 37))
+	assert adfgvx.columnar(data, word) == reference_columnar(data, word)
+	assert adfgvx.uncolumnar(adfgvx.columnar(data, word), word) == data
+
+
+def test_round_trip_5x5():
+	cipher = adfgvx.Adfgvx.from_keyword('KEYWORD', 'CARGO', None)
+	# Z is the last symbol of the 5x5 grid, which the lookup used to have no room for
+	ciphertext = cipher.encrypt('attackatdawnbythezoo')
+	assert set(ciphertext) <= set(adfgvx.ADFGX)
+	assert len(ciphertext) % 5 == 0
+	assert cipher.decrypt(ciphertext).startswith('attackatdawnbythezoo')
+
+
+def test_j_reads_as_i():
+	cipher = adfgvx.Adfgvx.from_keyword('KEYWORD', 'CARGO', None)
+	ciphertext = cipher.encrypt('justajollyjoke')
+	assert ciphertext == cipher.encrypt('iustaiollyioke')
+	assert cipher.decrypt(ciphertext).startswith('iustaiollyioke')
+
+
+def test_round_trip_6x6():
+	cipher = adfgvx.Adfgvx.create(GRID36, 'PRIVACY')
+	ciphertext = cipher.encrypt('attack at 1200am'.replace(' ', ''))
+	assert set(ciphertext) <= set(adfgvx.ADFGVX)
+	assert cipher.decrypt(ciphertext).startswith('attackat1200am')
+
+
+def test_bad_grid():
+	with pytest.raises(ValueError):
+		adfgvx.Adfgvx.create('ABCDEFGHIJ', 'WORD')
+	with pytest.raises(ValueError):
+		adfgvx.Adfgvx.create(GRID36, 'WORD', 'ADFGX')
+	with pytest.raises(ValueError):
+		adfgvx.Adfgvx.create(GRID36, 'WORD', 'AADFGX')
+	with pytest.raises(ValueError):
+		adfgvx.Adfgvx.from_keyword('KEYWORD', 'CARGO', None).encrypt('1st')
+
+
+def test_empty_word():
+	with pytest.raises(ValueError, match='transposition word'):
+		adfgvx.Adfgvx.create(GRID36, '')
+	with pytest.raises(ValueError, match='transposition word'):
+		adfgvx.Adfgvx(list(adfgvx.chunks_iter(GRID36, 6)), '', adfgvx.ADFGVX)
+
+
+def test_crack(english):
+	# the solver is seeded, so it finds the same grid and keyword every time
+	plain = normalize(english[2000:2800]).lower()
+	ciphertext = adfgvx.Adfgvx.from_keyword('KEYWORD', 'CARGO', None).encrypt(plain)
+	cipher = adfgvx.crack(ciphertext, Quadgrams.from_corpus(english), max_width=6, workers=1)
+	assert len(cipher.word) == 5
+	assert cipher.decrypt(ciphertext).startswith(plain.replace('j', 'i'))
+
+
+def test_crack_stray_symbols(english, tmp_path):
+	with pytest.raises(ValueError, match='EHLORW'):
+		adfgvx.crack('HELLOWORLD', None, workers=1)
+	path = tmp_path / 'english.txt'
+	path.write_text(english)
+	with pytest.raises(SystemExit):
+		adfgvx.main(['-s', str(path), 'HELLOWORLD'])
+
+
+def test_main_empty_word():
+	with pytest.raises(SystemExit):
+		adfgvx.main(['-g', 'KEYWORD', '-w', '', 'hello'])
+
+
+def test_bad_message():
+	cipher = adfgvx.Adfgvx.from_keyword('KEYWORD', 'CARGO', None)
+	with pytest.raises(ValueError):
+		cipher.decrypt('HELLOHELLO')
+	for argv in (['-d', 'HELLO'], ['-e', 'h3llo']):
+		with pytest.raises(SystemExit):
+			adfgvx.main(['-g', 'KEYWORD', '-w', 'CARGO', *argv])
+
+
+def test_crack_width():
+	with pytest.raises(ValueError):
+		adfgvx.crack('ADFGXADFGXA', None, max_width=6, workers=1)
@@ -0,0 +1,70 @@
+import random
+import pytest
+import autokey
+from string import ascii_letters, ascii_uppercase
+from crypto import CustomAlphabet, OFFSET_UPPER, OFFSET_LOWER
+
+
+def random_text(rng, length, letters=ascii_letters):
+	return ''.join(rng.choice(letters) for _ in range(length))
+
+
+@pytest.mark.parametrize('key_length', [1, 4, 30])
+def test_bulk_matches_reference(key_length):
+	rng = random.Random(key_length)
+	message = random_text(rng, 2000)
+	key = random_text(rng, key_length, ascii_uppercase)
+	ciphertext = autokey.encrypt(message, key)
+	assert ciphertext == autokey.autokey(message, key, +1, OFFSET_UPPER)
+	assert autokey.decrypt(ciphertext, key) == autokey.autokey(ciphertext, key, -1, OFFSET_LOWER)
+
+
+def test_round_trip():
+	# after the key runs out, each letter is shifted by the ciphertext five letters back
+	assert autokey.encrypt('attackatdawn', 'QUEEN') == 'QNXEPANQHPWA'
+	assert autokey.decrypt('QNXEPANQHPWA', 'QUEEN') == 'attackatdawn'
+
+
+def test_stream_matches_whole():
+	rng = random.Random(0)
+	message = random_text(rng, 3000)
+	bounds = sorted(rng.sample(range(1, len(message)), 12))
+	chunks = [message[i:j] for i, j in zip([0] + bounds, bounds + [len(message)])]
+	ciphertext = autokey.encrypt(message, 'KEYWORD')
+	assert ''.join(autokey.encrypt_stream(chunks, 'KEYWORD')) == ciphertext
+	# the state carries a stream over to a later call
+	state = autokey.feedback('KEYWORD')
+	first = ''.join(autokey.decrypt_stream([ciphertext[:1000]], 'KEYWORD', state))
+	assert first + ''.join(autokey.decrypt_stream([ciphertext[1000:]], 'KEYWORD', state)) == message.lower()
+
+
+def test_parallel_decrypt(monkeypatch):
+	monkeypatch.setattr(autokey, 'PARALLEL_SIZE', 1000)
+	monkeypatch.setattr(autokey, 'WINDOW_SIZE', 700)
+	message = random_text(random.Random(1), 5000)
+	ciphertext = autokey.encrypt(message, 'KEYWORD')
+	assert autokey.decrypt(ciphertext, 'KEYWORD', workers=2) == message.lower()
+	# but not unless workers are asked for
+	monkeypatch.setattr('concurrent.futures.ProcessPoolExecutor', None)
+	assert autokey.decrypt(ciphertext, 'KEYWORD') == message.lower()
+
+
+def test_empty_key(monkeypatch):
+	with pytest.raises(ValueError):
+		autokey.encrypt('hello', '')
+	# checked before any pool is started
+	monkeypatch.setattr(autokey, 'PARALLEL_SIZE', 10)
+	monkeypatch.setattr('concurrent.futures.ProcessPoolExecutor', None)
+	with pytest.raises(ValueError):
+		autokey.decrypt('hello' * 1000, '', workers=2)
+	with pytest.raises(SystemExit):
+		autokey.main(['-k', '123', 'hello'])
+
+
+def test_custom_alphabet():
+	alphabet = CustomAlphabet('ABCDEFGHIJKLMNOPQRSTUVWXYZ .,')
+	rng = random.Random(1)
+	message = random_text(rng, 2000, alphabet.letters)
+	expected = ''.join(autokey.autokey(message, 'KEY WORD', +1, OFFSET_UPPER, alphabet))
+	assert autokey.encrypt(message, 'KEY WORD', alphabet) == expected
+	assert autokey.decrypt(expected, 'KEY WORD', alphabet).upper() == message
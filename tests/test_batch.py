@@ -0,0 +1,57 @@
+import io
+import json
+import batch
+import greenwall
+import cryptoargs
+
+
+RECORDS = [
+	{'id': 1, 'cipher': 'vigenere', 'key': 'LEMON', 'text': 'attack at dawn'},
+	{'id': 2, 'cipher': 'vigenere', 'key': 'LEMON', 'text': 'LXFOPVEFRNHR'},
+	{'id': 3, 'cipher': 'adfgvx', 'grid': 'KEYWORD', 'word': 'CARGO', 'text': 'HELLOWORLD', 'mode': 'decrypt'},
+	{'id': 4, 'cipher': 'enigma', 'text': 'hello'},
+	{'id': 5, 'cipher': 'playfair', 'text': 'hello'},
+	{'id': 6, 'cipher': 'greenwall', 'horizontal': 'KEY', 'vertical': 'WORD', 'text': 'hello', 'mode': 'sideways'},
+	{'id': 7, 'cipher': 'vigenere', 'key': 123, 'text': 'hello'},
+	{'id': 8, 'cipher': 'vigenere', 'key': 'LEMON', 'text': ['hello']},
+	{'id': 9, 'cipher': 'adfgvx', 'grid': 'KEYWORD', 'word': '', 'text': 'hello'},
+	{'id': 10, 'cipher': 'vigenere', 'key': '123', 'text': 'hello'},
+	[1, 2],
+	'text',
+]
+
+
+def test_run():
+	results = list(batch.process(RECORDS))
+	assert results[:2] == [{'id': 1, 'text': 'LXFOPVEFRNHR'}, {'id': 2, 'text': 'attackatdawn'}]
+	# every other record is answered with an error, keeping its id
+	for record, result in zip(RECORDS[2:], results[2:]):
+		assert list(result) == (['id', 'error'] if isinstance(record, dict) else ['error'])
+
+
+def test_keys_match_command_line(capsys):
+	# the keys are normalized as the command line does
+	greenwall.main(['-z', 'KEY1', '-v', 'WORD', '-e', 'hello'])
+	out, _ = capsys.readouterr()
+	record = {'cipher': 'greenwall', 'horizontal': 'KEY1', 'vertical': 'WORD', 'text': 'hello', 'mode': 'encrypt'}
+	assert list(batch.process([record])) == [{'text': out.strip()}]
+
+
+def test_workers():
+	assert list(batch.process(RECORDS, 1)) == list(batch.process(RECORDS))
+
+
+def test_invalid_json():
+	lines = io.StringIO('{"cipher": "vigenere", "key": "A", "text": "abc"}\n\n{not json\n')
+	results = list(batch.process(cryptoargs.read_records(lines)))
+	assert results[0] == {'text': 'ABC'}
+	assert list(results[1]) == ['error']
+	json.dumps(results)
+
+
+def test_unexpected_error(monkeypatch):
+	def fail(text):
+		raise ZeroDivisionError('division by zero')
+	monkeypatch.setitem(batch.CIPHERS, 'failing', (lambda key: (fail, fail), ('key',)))
+	results = list(batch.process([{'cipher': 'failing', 'key': 'A', 'text': 'abc'}, RECORDS[0]]))
+	assert results == [{'error': 'division by zero'}, {'id': 1, 'text': 'LXFOPVEFRNHR'}]
@@ -0,0 +1,29 @@
+import json
+import pytest
+import bench
+
+
+def results(**seconds):
+	return {'results': {key: {'seconds': value, 'rate': 1 / value, 'unit': 'chars/s'} for key, value in seconds.items()}}
+
+
+def test_compare():
+	rows = bench.compare(results(a=1.0, b=2.0), results(a=1.5, b=1.0, c=1.0))
+	assert rows == [('a', 1.0, 1.5, 0.5), ('b', 2.0, 1.0, -0.5)]
+
+
+def test_compare_main(tmp_path, capsys):
+	base, new = tmp_path / 'base.json', tmp_path / 'new.json'
+	base.write_text(json.dumps(results(a=1.0, b=1.0)))
+	new.write_text(json.dumps(results(a=1.05, b=1.5)))
+	with pytest.raises(SystemExit, match='1 regression'):
+		bench.main(['compare', str(base), str(new)])
+	assert 'REGRESSION' in capsys.readouterr().out
+	bench.main(['compare', str(base), str(new), '-t', '0.6'])
+
+
+def test_run():
+	report = bench.run(sizes=(64,), analysis=False)
+	assert report['sizes'] == [64]
+	assert all(key.endswith('/64') and result['seconds'] > 0 for key, result in report['results'].items())
+	assert {key.split('/')[0].rsplit('.', 1)[1] for key in report['results']} == {'encrypt', 'decrypt'}
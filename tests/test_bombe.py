@@ -0,0 +1,41 @@
+import pytest
+import bombe
+from crypto import acode
+from enigmacty import default_enigma, create_plugboard
+from enigmacore import position_index
+
+
+def test_search_shard_finds_setting():
+	enigma = default_enigma()
+	enigma.plugboard = create_plugboard(['AQ', 'KZ', 'TX'])
+	enigma.set_rotor_order((2, 0, 1))
+	enigma.set_trigraph('QWE')
+	crib = 'THEWEATHERTODAYISCLEARANDCOLD'
+	ciphertext = 'XYZ' + enigma.process_text(crib)
+	# hits report the positions at the start of the message, three letters before the crib
+	start = position_index([acode(c) for c in 'QWE']) - 3
+	first = start - start % bombe.SHARD_SIZE
+	hits = bombe.search_shard((2, 0, 1), first, first + bombe.SHARD_SIZE, ciphertext, crib, [3])
+	assert [hit[:3] for hit in hits] == [((2, 0, 1), 'NWE', 3)]
+	assert {'AQ', 'KZ', 'TX'} <= set(hits[0][3].split())
+
+
+def test_valid_offsets():
+	assert list(bombe.valid_offsets('ABCAB', 'AB')) == [1, 2]
+
+
+@pytest.mark.parametrize('crib, offset', [
+	('', None),
+	('ABCDEFGH', None),
+	('XY', 9),
+	('XY', -1),
+	('BB', 1),
+])
+def test_search_rejects_bad_crib(crib, offset):
+	with pytest.raises(ValueError):
+		bombe.search('ABCDEFG', crib, offset)
+
+
+def test_menu_loops_empty():
+	with pytest.raises(ValueError):
+		bombe.menu_loops(bombe.create_menu([], []))
@@ -0,0 +1,33 @@
+import json
+import pytest
+import ciphers
+import instrument
+
+
+def test_usage(capsys):
+	ciphers.main([])
+	out = capsys.readouterr().out
+	assert all(name in out for name in ciphers.COMMANDS)
+
+
+@pytest.mark.parametrize('argv, message', [(['nope'], 'unknown command'), (['--stats'], 'needs a value')])
+def test_errors(argv, message):
+	with pytest.raises(SystemExit, match=message):
+		ciphers.main(argv)
+
+
+def test_dispatch(capsys):
+	ciphers.main(['vigenere', '-k', 'LEMON', '-e', 'attackatdawn'])
+	assert capsys.readouterr().out.strip() == 'LXFOPVEFRNHR'
+
+
+def test_stats(tmp_path, capsys):
+	path = tmp_path / 'stats.json'
+	instrument.reset()
+	try:
+		ciphers.main(['--stats', str(path), 'playfair', '-k', 'MONARCHY', '-e', 'hello'])
+	finally:
+		instrument.disable()
+		instrument.reset()
+	assert capsys.readouterr().out.strip()
+	assert json.loads(path.read_text())['playfair.Playfair._encrypt']['chars'] == len('helxlo')
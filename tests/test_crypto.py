@@ -0,0 +1,99 @@
+import random
+import sys
+import pytest
+from array import array
+import crypto
+from crypto import Quadgrams, normalize
+
+
+@pytest.fixture(scope='module')
+def quadgrams(english):
+	return Quadgrams.from_corpus(english)
+
+
+def test_quadgrams_save_load(tmp_path, english, quadgrams):
+	path = tmp_path / 'quadgrams'
+	quadgrams.save(path)
+	plain = crypto.ALPHABET.encode_all(normalize(english)[:500].upper())
+	with Quadgrams.load(path) as loaded:
+		assert loaded.score(plain) == quadgrams.score(plain)
+	with Quadgrams.open(path) as loaded:
+		assert loaded.score(plain) == quadgrams.score(plain)
+
+
+@pytest.mark.skipif(sys.byteorder != 'little', reason='needs a little-endian host')
+def test_quadgrams_load_big_endian(tmp_path, quadgrams, monkeypatch):
+	# pretending to be big-endian, load swaps the little-endian file into a copy
+	path = tmp_path / 'quadgrams'
+	quadgrams.save(path)
+	monkeypatch.setattr(sys, 'byteorder', 'big')
+	loaded = Quadgrams.load(path)
+	assert isinstance(loaded.table, array)
+	loaded.table.byteswap()
+	assert loaded.table == quadgrams.table
+
+
+@pytest.mark.parametrize('text, keep, expected', [
+	('Hello, World!', '', 'HelloWorld'),
+	('Hello, World!', ' ,', 'Hello, World'),
+	('Crème brûlée à la façon', '', 'Cremebruleealafacon'),
+	('Straße, Æsir, þorn', '', 'StrasseAEsirthorn'),
+	('Œuvre, Łódź, ﬁn', '', 'OEuvreLodzfin'),
+	('１２３ ⁴ ½ ① ３', '0123456789', '1233'),
+	('x½y¼z', '0123456789', 'xyz'),
+	('a²b', '0123456789', 'ab'),
+	('ΑΒΓ 中文', '', ''),
+])
+def test_normalize(text, keep, expected):
+	assert normalize(text, keep) == expected
+
+
+def test_normalize_paths_agree():
+	# the latin-1 bytes path folds each character as the general one does
+	latin = ''.join(map(chr, range(0x20, 0x100)))
+	assert normalize(latin, '0123456789') == normalize(latin + 'ā', '0123456789')[:-1]
+	assert normalize(latin) == ''.join(normalize(c) for c in latin)
+
+
+def test_standard_alphabet():
+	alphabet = crypto.StandardAlphabet(' .')
+	assert alphabet.size == 28
+	assert alphabet.encode_all('Az .') == bytes([0, 25, 26, 27])
+	assert alphabet.decode_all(bytes([0, 25, 26, 27, 28]), lower=True) == 'az .a'
+
+
+def test_custom_alphabet():
+	alphabet = crypto.CustomAlphabet('XyZé')
+	assert alphabet.encode_all('xYzÉ') == bytes([0, 1, 2, 3])
+	assert alphabet.decode_all(bytes([3, 2, 1, 0, 4])) == 'ÉZYXX'
+	with pytest.raises(ValueError, match='not in the alphabet'):
+		alphabet.encode_all('XYA')
+	with pytest.raises(ValueError, match='not in the alphabet'):
+		alphabet.encode('ā')
+
+
+@pytest.mark.parametrize('letters', ['', 'ABA', 'Aa', 'AĀ'])
+def test_custom_alphabet_invalid(letters):
+	with pytest.raises(ValueError):
+		crypto.CustomAlphabet(letters)
+
+
+def test_quadgram_indices():
+	rng = random.Random(0)
+	plain = bytes(rng.randrange(36) for _ in range(500))
+	clamped = [min(a, 25) for a in plain]
+	expected = [a * 17576 + b * 676 + c * 26 + d for a, b, c, d in zip(clamped, clamped[1:], clamped[2:], clamped[3:])]
+	assert crypto.quadgram_indices(plain).tolist() == expected
+	assert len(crypto.quadgram_indices(plain[:3])) == 0
+
+
+def test_rescore(quadgrams):
+	rng = random.Random(1)
+	old = bytes(rng.randrange(26) for _ in range(200))
+	for positions in ([0], [199], [5, 6, 100], [3, 50, 197]):
+		new = bytearray(old)
+		for p in positions:
+			new[p] = rng.randrange(26)
+		new = bytes(new)
+		delta = quadgrams.rescore(old, new, positions)
+		assert delta == pytest.approx(quadgrams.score(new) - quadgrams.score(old), abs=1e-3)
@@ -0,0 +1,30 @@
+import argparse
+import cryptoargs
+
+
+def parse(argv):
+	parser = argparse.ArgumentParser()
+	cryptoargs.add_input(parser)
+	cryptoargs.add_output(parser)
+	return parser.parse_args(argv)
+
+
+def test_read_chunks(tmp_path):
+	path = tmp_path / 'message'
+	path.write_text('abcdefghij')
+	assert list(cryptoargs.read_chunks(parse(['-i', str(path)]), 4)) == ['abcd', 'efgh', 'ij']
+	assert list(cryptoargs.read_chunks(parse(['abcdefghij']), 4)) == ['abcdefghij']
+
+
+def test_write_chunks(tmp_path):
+	path = tmp_path / 'result'
+	cryptoargs.write_chunks(parse(['-o', str(path), 'x']), iter(['ab', 'cd']))
+	assert path.read_text() == 'abcd'
+
+
+def test_probe_chunks():
+	plaintext, chunks = cryptoargs.probe_chunks(iter(['', '12 ', 'Hello', 'world']))
+	assert not plaintext
+	assert list(chunks) == ['', '12 ', 'Hello', 'world']
+	plaintext, chunks = cryptoargs.probe_chunks(iter(['123']))
+	assert plaintext and list(chunks) == ['123']
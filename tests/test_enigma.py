@@ -0,0 +1,86 @@
+import pytest
+from collections import Counter
+import enigma
+
+
+def test_catalog_lookup(tmp_path):
+	path = tmp_path / 'cycles'
+	settings = {enigma.catalog_key('13/12,1,12,1/13'): [0, 5], enigma.catalog_key('10,3,10,3/13/13'): [enigma.TOTAL_POSITIONS + 1]}
+	assert enigma.write_catalog(path, settings) == 2
+	with enigma.CycleCatalog(path) as catalog:
+		assert catalog.lookup('13/1,12,1,12/13') == [((0, 1, 2), 'AAA'), ((0, 1, 2), 'FAA')]
+		assert catalog.lookup('3,10,3,10/13/13') == [((0, 2, 1), 'BAA')]
+		assert catalog.lookup('13/13/13') == []
+
+
+def test_catalog_hash_collision(tmp_path, monkeypatch):
+	# every key hashing alike must still only find its own settings
+	monkeypatch.setattr(enigma, 'catalog_hash', lambda key: 7)
+	path = tmp_path / 'cycles'
+	enigma.write_catalog(path, {'13/13/13': [1], '12,12,1,1/13/13': [2]})
+	with enigma.CycleCatalog(path) as catalog:
+		assert catalog.lookup('13/13/13') == [((0, 1, 2), 'BAA')]
+		assert catalog.lookup('1,12,1,12/13/13') == [((0, 1, 2), 'CAA')]
+		assert catalog.lookup('11,11,2,2/13/13') == []
+
+
+def test_process_command(tmp_path, capsys):
+	settings = ['-r', '201', '-p', 'QWE', '-s', 'AQ,KZ']
+	enigma.main(['process', *settings, 'Hello, world'])
+	ciphertext = capsys.readouterr().out
+	assert len(ciphertext) == 10
+	path = tmp_path / 'plain'
+	enigma.main(['process', *settings, '-o', str(path), ciphertext])
+	assert path.read_text() == 'HELLOWORLD'
+
+
+def test_process_command_jobs(tmp_path, capsys, monkeypatch):
+	# the whole file goes to one pool, and the output matches a serial run
+	monkeypatch.setattr(enigma, 'PARALLEL_SIZE', 100)
+	calls = []
+	process_windows = enigma.Enigma.process_windows
+	monkeypatch.setattr(enigma.Enigma, 'process_windows', lambda self, *args: calls.append(args) or process_windows(self, *args))
+	path = tmp_path / 'plain'
+	path.write_text('hello world ' * 30)
+	enigma.main(['process', '-j', '2', '-i', str(path)])
+	assert len(calls) == 1
+	enigma.main(['process', '-i', str(path)])
+	out, _ = capsys.readouterr()
+	assert out[:len(out) // 2] == out[len(out) // 2:]
+
+
+def test_process_command_rejects_settings():
+	for settings in (['-r', '01'], ['-p', 'AB'], ['-s', 'AB,BC']):
+		with pytest.raises(SystemExit):
+			enigma.main(['process', *settings, 'HELLO'])
+
+
+def test_query_command_rejects_fingerprints(tmp_path):
+	for fingerprint in ('x/1', '13/13', '13,x/1/1'):
+		with pytest.raises(SystemExit):
+			enigma.main(['query', str(tmp_path / 'catalog'), fingerprint])
+
+
+def test_position_tables():
+	machine = enigma.default_enigma()
+	machine.set_rotor_order((2, 0, 1))
+	tables = machine.position_tables()
+	assert len(tables) == enigma.TOTAL_POSITIONS
+	for index in (0, 1, 25, 26, 677, enigma.TOTAL_POSITIONS - 1):
+		machine.position_index = index
+		assert tables[index] == machine.permutation()
+
+
+def test_order_structures():
+	# each fingerprint is the cycle structure of the first three indicator letters
+	structures = enigma.order_structures((1, 2, 0))
+	machine = enigma.default_enigma()
+	machine.set_rotor_order((1, 2, 0))
+	for index in (0, 100, 17575):
+		expected = []
+		for j in range(3):
+			machine.position_index = index + j
+			cycles = enigma.get_cycle_structure(machine)
+			expected.append(frozenset(Counter(map(len, cycles)).items()))
+		assert structures[index] == tuple(expected)
+	assert '/' in enigma.fmt_fingerprint(structures[0])
@@ -0,0 +1,111 @@
+import random
+import pytest
+import enigma
+import enigmacty
+from enigmacore import position_index, index_positions, step_positions
+
+
+@pytest.fixture(params=[(enigma, False), (enigmacty, False), (enigmacty, True)], ids=['enigma', 'enigmacty', 'compiled'])
+def machine(request):
+	module, compiled = request.param
+	machine = module.default_enigma()
+	if compiled:
+		machine.compiled = True
+	machine.plugboard = module.create_plugboard(['AQ', 'KZ', 'TX'])
+	machine.set_rotor_order((1, 2, 0))
+	machine.set_trigraph('XYZ')
+	return machine
+
+
+def test_positions():
+	assert position_index((1, 2, 3)) == 1 + 2 * 26 + 3 * 676
+	assert index_positions(position_index((25, 0, 7))) == (25, 0, 7)
+	assert step_positions((25, 25, 25), 1) == (0, 0, 0)
+	assert step_positions((24, 25, 0), 2) == (0, 0, 1)
+
+
+def test_advance_matches_stepping(machine):
+	for amount in (1, 25, 26, 677, 20000):
+		expected = machine.positions
+		for _ in range(amount):
+			machine.step()
+		stepped = machine.positions
+		machine.set_positions(expected)
+		machine.advance(amount)
+		assert machine.positions == stepped
+
+
+def test_permutation_matches_apply(machine):
+	rng = random.Random(0)
+	for _ in range(5):
+		offset = rng.randrange(20000)
+		table = machine.permutation(offset=offset)
+		start = machine.positions
+		machine.advance(offset)
+		assert list(table) == [machine.apply(a) for a in range(26)]
+		machine.set_positions(start)
+	other = machine.permutation((2, 0, 1), (3, 4, 5))
+	machine.set_rotor_order((2, 0, 1))
+	machine.set_positions((3, 4, 5))
+	assert list(other) == [machine.apply(a) for a in range(26)]
+
+
+def test_machines_agree():
+	text = ''.join(random.Random(1).choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(5000))
+	results = []
+	for module in (enigma, enigmacty):
+		machine = module.default_enigma()
+		machine.plugboard = module.create_plugboard(['AB', 'CD'])
+		machine.set_rotor_order((2, 1, 0))
+		machine.set_trigraph('QRS')
+		results.append(machine.process_text(text))
+	assert results[0] == results[1]
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_windows_match_serial(machine, compiled):
+	if compiled:
+		if not isinstance(machine, enigmacty.Enigma):
+			pytest.skip('only enigmacty compiles its tables')
+		machine.compiled = True
+	text = ''.join(random.Random(2).choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(30000))
+	start = machine.positions
+	expected = machine.process_text(text)
+	end = machine.positions
+	machine.set_positions(start)
+	assert machine.process_windows(text, 2, size=7000) == expected
+	assert machine.positions == end
+
+
+def test_no_pool_by_default(machine, monkeypatch):
+	def process_windows(*args, **kwargs):
+		raise AssertionError('a pool was started')
+	monkeypatch.setattr(type(machine), 'process_windows', process_windows)
+	monkeypatch.setattr(f'{type(machine).__module__}.PARALLEL_SIZE', 10)
+	machine.process_text('HELLOWORLD' * 10)
+	machine.process_text('HELLOWORLD' * 10, 1)
+	with pytest.raises(AssertionError):
+		machine.process_text('HELLOWORLD' * 10, 2)
+
+
+def test_reflector_change(machine):
+	module = enigma if isinstance(machine, enigma.Enigma) else enigmacty
+	text = 'HELLOWORLD' * 10
+	start = machine.positions
+	machine.process_text(text)
+	machine.reflector = module.create_reflector('EJMZALYXVBWFCRQUONTSPIKHGD')
+	machine.set_positions(start)
+	changed = machine.process_text(text)
+	fresh = module.default_enigma()
+	fresh.reflector = machine.reflector
+	fresh.plugboard = machine.plugboard
+	fresh.set_rotor_order((1, 2, 0))
+	fresh.set_positions(start)
+	assert changed == fresh.process_text(text)
+
+
+def test_rotor_order_change(machine):
+	machine.process_text('HELLOWORLD')
+	machine.set_rotor_order((0, 1, 2))
+	assert not machine._inner_tables
+	assert list(machine.permutation()) == [machine.apply(a) for a in range(26)]
@@ -0,0 +1,50 @@
+import random
+import pytest
+import enigmacty
+from string import ascii_uppercase
+
+
+def test_default_rotors():
+	# the wiring of Enigma I rotor I, read off at position A
+	machine = enigmacty.default_enigma()
+	rotor = machine.rotor_order[0]
+	assert rotor.name == 'Enigma I-1'
+	assert ''.join(enigmacty.letter(rotor.forward(a)) for a in range(26)) == 'EKMFLGDQVZNTOWYHXUSPAIBRCJ'
+	assert [rotor.backward(rotor.forward(a)) for a in range(26)] == list(range(26))
+
+
+def test_involution():
+	machine = enigmacty.default_enigma()
+	machine.set_trigraph('MCK')
+	ciphertext = machine.process_text('ATTACKATDAWN')
+	assert all(c != p for c, p in zip(ciphertext, 'ATTACKATDAWN'))
+	machine.set_trigraph('MCK')
+	assert machine.process_text(ciphertext) == 'ATTACKATDAWN'
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_compiled_matches_stepping(seed):
+	rng = random.Random(seed)
+	plain = enigmacty.default_enigma()
+	compiled = enigmacty.default_enigma()
+	compiled.compiled = True
+	letters = rng.sample(ascii_uppercase, 6)
+	plugs = [letters[0:2], letters[2:4], letters[4:6]]
+	order = rng.sample(range(3), 3)
+	trigraph = ''.join(rng.choice(ascii_uppercase) for _ in range(3))
+	text = ''.join(rng.choice(ascii_uppercase) for _ in range(rng.randrange(1, 40000)))
+	for machine in (plain, compiled):
+		machine.plugboard = enigmacty.create_plugboard(plugs)
+		machine.set_rotor_order(order)
+		machine.set_trigraph(trigraph)
+	assert compiled.process_text(text) == plain.process_text(text)
+	assert compiled.positions == plain.positions
+
+
+def test_bad_wiring():
+	with pytest.raises(ValueError):
+		enigmacty.create_rotor('ABC')
+	with pytest.raises(ValueError):
+		enigmacty.create_reflector(ascii_uppercase)
+	with pytest.raises(ValueError):
+		enigmacty.create_plugboard(['AA'])
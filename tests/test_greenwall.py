@@ -0,0 +1,66 @@
+import random
+import pytest
+import greenwall
+from crypto import normalize, CustomAlphabet
+
+
+@pytest.fixture(scope='module')
+def message(english):
+	return normalize(english, greenwall.PUNCT)[:3000]
+
+
+@pytest.mark.parametrize('func', [greenwall.enc_func, greenwall.dec_func])
+@pytest.mark.parametrize('start', [0, 1000])
+@pytest.mark.parametrize('bulk_stride', [0, greenwall.BULK_STRIDE])
+def test_bulk_matches_reference(message, func, start, bulk_stride, monkeypatch):
+	# a stride of 0 takes the table path whatever the length
+	monkeypatch.setattr(greenwall, 'BULK_STRIDE', bulk_stride)
+	expected = greenwall.greenwall(message, 'HORIZON', 'VERTEX', func, start)
+	assert greenwall.greenwall_bulk(message, 'HORIZON', 'VERTEX', func, start) == expected
+
+
+def test_round_trip(message):
+	ciphertext = greenwall.encrypt(message, 'KEY', 'WORD')
+	assert greenwall.decrypt(ciphertext, 'KEY', 'WORD') == message.lower()
+
+
+def test_stream_matches_whole(message):
+	rng = random.Random(0)
+	bounds = sorted(rng.sample(range(1, len(message)), 10))
+	chunks = [message[i:j] for i, j in zip([0] + bounds, bounds + [len(message)])]
+	assert ''.join(greenwall.encrypt_stream(chunks, 'KEY', 'WORD')) == greenwall.encrypt(message, 'KEY', 'WORD')
+
+
+@pytest.mark.parametrize('key_horiz, key_vert', [('', 'WORD'), ('KEY', '')])
+def test_empty_key(message, key_horiz, key_vert):
+	with pytest.raises(ValueError):
+		greenwall.encrypt(message, key_horiz, key_vert)
+	with pytest.raises(ValueError):
+		list(greenwall.decrypt_stream([], key_horiz, key_vert))
+
+
+def test_custom_alphabet(monkeypatch):
+	alphabet = CustomAlphabet('ABCDEFGHIJKLMNOPQRSTUVW')
+	ciphertext = greenwall.encrypt('HELLOWORLD', 'KEG', 'VASE', alphabet)
+	assert greenwall.decrypt(ciphertext, 'KEG', 'VASE', alphabet) == 'helloworld'
+	monkeypatch.setattr(greenwall, 'BULK_STRIDE', 0)
+	message = 'ABCDEFGHIJKLMNOPQRSTUVW' * 100
+	expected = greenwall.greenwall(message, 'KEG', 'VASE', greenwall.enc_func, alphabet=alphabet)
+	assert greenwall.encrypt(message, 'KEG', 'VASE', alphabet) == expected
+
+
+def test_alphabet_size_not_prime():
+	alphabet = CustomAlphabet('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+	with pytest.raises(ValueError):
+		greenwall.encrypt('HELLOWORLD', 'KEG', 'VASE', alphabet)
+
+
+def test_vertical_key_last_symbol():
+	with pytest.raises(ValueError):
+		greenwall.encrypt('HELLO', 'KEY', 'STOP.')
+
+
+@pytest.mark.parametrize('key_horiz, key_vert', [('', 'WORD'), ('KEY', '!?'), ('KEY', 'STOP.')])
+def test_main_rejects_keys(key_horiz, key_vert):
+	with pytest.raises(SystemExit):
+		greenwall.main(['-z', key_horiz, '-v', key_vert, 'HELLO'])
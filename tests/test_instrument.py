@@ -0,0 +1,52 @@
+import pytest
+import instrument
+import playfair
+import enigmacty
+from playfair import Playfair
+
+
+@pytest.fixture
+def stats():
+	instrument.reset()
+	instrument.enable()
+	yield instrument.stats
+	instrument.disable()
+	instrument.reset()
+
+
+def test_measured(stats):
+	playfair.cell_pairs_table.cache_clear()
+	cipher = Playfair.from_keyword('MONARCHY')
+	assert not stats
+	cipher.encrypt('hello')
+	cipher.encrypt('world')
+	snapshot = instrument.snapshot()
+	# the table is timed where it is built, on first use
+	assert snapshot['playfair.cell_pairs_table']['calls'] == 1
+	assert snapshot['playfair.Playfair._encrypt']['chars'] == 12
+	assert sum(snapshot['playfair.Playfair._encrypt']['histogram'].values()) == 2
+
+
+def test_setup_measured_on_miss(stats):
+	machine = enigmacty.default_enigma()
+	machine.compiled = True
+	machine.process_text('HELLOWORLD' * 100)
+	machine.process_text('HELLOWORLD')
+	machine.set_trigraph('AAA')
+	machine.process_text('HELLOWORLD' * 100)
+	snapshot = instrument.snapshot()
+	assert snapshot['enigmacty.Enigma._build_compiled_table']['calls'] == 1
+	machine = enigmacty.default_enigma()
+	counts = []
+	for _ in range(3):
+		machine.set_trigraph('AAA')
+		machine.process_text('HELLOWORLD' * 10)
+		counts.append(instrument.snapshot()['enigmacore.RotorMachine._build_inner_table']['calls'])
+	# later passes over the same positions find every inner table cached
+	assert counts[0] == counts[1] == counts[2] > 1
+
+
+def test_disabled():
+	instrument.reset()
+	Playfair.from_keyword('MONARCHY').encrypt('hello')
+	assert not instrument.stats
@@ -0,0 +1,25 @@
+import pytest
+import keygen
+from collections import Counter
+
+
+@pytest.mark.parametrize('alphabet', [keygen.ALPHA, keygen.ALPHABETS['29'], keygen.ALPHABETS['36'], 'AB', 'ĀĒĪ'])
+def test_generate_bulk(alphabet):
+	chunks = list(keygen.generate_bulk(alphabet, 2500, size=1000))
+	assert list(map(len, chunks)) == [1000, 1000, 500]
+	assert set(''.join(chunks)) == set(alphabet)
+
+
+def test_sample_table_unbiased():
+	# every symbol gets the same share of the bytes that are kept
+	for size in (25, 26, 29, 36):
+		table, rejected = keygen.sample_table(keygen.ALPHA[:size] if size <= 26 else keygen.ALPHABETS[str(size)])
+		counts = Counter(table[:256 - len(rejected)])
+		assert len(set(counts.values())) == 1 and len(counts) == size
+
+
+def test_grids():
+	grids = list(keygen.grids(keygen.ALPHABETS['25'], 3000))
+	assert len(grids) == 3000
+	assert all(sorted(grid) == sorted(keygen.ALPHABETS['25']) for grid in grids)
+	assert len(set(grids)) == 3000
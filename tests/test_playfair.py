@@ -0,0 +1,111 @@
+import time
+import random
+import pytest
+import playfair
+from crypto import ALPHABET, Quadgrams, normalize
+
+
+@pytest.fixture(scope='module')
+def quadgrams(english):
+	return Quadgrams.from_corpus(english)
+
+
+def test_decrypt_cells():
+	rng = random.Random(1)
+	alpha = list(playfair.ALPHA)
+	rng.shuffle(alpha)
+	grid = ''.join(alpha)
+	cipher = ''.join(rng.choice(alpha) for _ in range(400))
+	cipher = ''.join(a + b for a, b in zip(cipher[0::2], cipher[1::2]) if a != b)
+	plain = playfair.decrypt_cells(ALPHABET.encode_all(grid), ALPHABET.encode_all(cipher))
+	expected = playfair.Playfair(list(playfair.chunks_iter(grid, 5))).decrypt(cipher)
+	assert ALPHABET.decode_all(plain, lower=True) == expected
+
+
+def test_anneal_keeps_starting_grid(english, quadgrams, monkeypatch):
+	# restarts that never get to take a step still report their grid
+	monkeypatch.setattr(playfair, 'RESTART_STEPS', 0)
+	cipher = ALPHABET.encode_all(playfair.Playfair.from_keyword('KEYWORD').encrypt(normalize(english)[:200]).upper())
+	alphabet = list(ALPHABET.encode_all(playfair.ALPHA))
+	score, grid = playfair.anneal(cipher, alphabet, quadgrams, time.monotonic() + 0.1, 0)
+	assert sorted(grid) == sorted(alphabet)
+	assert score == quadgrams.score(playfair.decrypt_cells(grid, cipher))
+
+
+def test_crack_seeded(english, quadgrams):
+	ciphertext = playfair.Playfair.from_keyword('KEYWORD').encrypt(normalize(english)[:200])
+	key, score = playfair.crack(ciphertext, quadgrams, budget=1, workers=1)
+	assert sorted(key) == sorted(playfair.ALPHA)
+	assert score == quadgrams.score(ALPHABET.encode_all(playfair.Playfair.from_keyword(key).decrypt(ciphertext).upper()))
+
+
+def test_crack_without_time():
+	with pytest.raises(ValueError):
+		playfair.crack('ABCD', None, budget=0, workers=1)
+
+
+def test_stream_matches_whole():
+	rng = random.Random(3)
+	cipher = playfair.Playfair.from_keyword('MONARCHY')
+	# doubled letters and chunk boundaries inside pairs are where streaming can go wrong
+	message = ''.join(rng.choice('abcdeeffgllmnoopqrsst') for _ in range(1001))
+	for size in (1, 2, 3, 50):
+		chunks = [message[i:i + size] for i in range(0, len(message), size)]
+		assert ''.join(cipher.encrypt_stream(chunks)) == cipher.encrypt(message)
+	ciphertext = cipher.encrypt(message)
+	chunks = [ciphertext[i:i + 7] for i in range(0, len(ciphertext), 7)]
+	assert ''.join(cipher.decrypt_stream(chunks)) == cipher.decrypt(ciphertext)
+
+
+def reference_encrypt(cipher, message, shift=1):
+	# one pair at a time, as Playfair.encrypt did before the cell pair tables
+	result = []
+	i = 0
+	while i < len(message):
+		c1 = message[i]
+		i += 1
+		c2 = message[i] if i < len(message) else playfair.pad(c1)
+		# a letter and its other case share a cell, so they are a double too
+		if c1.upper() == c2.upper():
+			c2 = playfair.pad(c1)
+		else:
+			i += 1
+		result.extend(cipher.encrypt_pair(c1, c2, shift))
+	return ''.join(result)
+
+
+@pytest.mark.parametrize('shift', [1, -1])
+def test_cell_pairs_match_reference(shift):
+	rng = random.Random(shift)
+	cipher = playfair.Playfair.from_keyword('MONARCHY')
+	for _ in range(20):
+		message = ''.join(rng.choice('AABXXQQxqzZmnoop') for _ in range(rng.randrange(1, 300)))
+		assert cipher.encrypt(message, shift) == reference_encrypt(cipher, message, shift)
+
+
+def test_from_keyword():
+	cipher = playfair.Playfair.from_keyword('PLAYFAIREXAMPLE')
+	assert [''.join(row) for row in cipher.grid] == ['PLAYF', 'IREXM', 'BCDGH', 'KNOQS', 'TUVWZ']
+	assert cipher.encrypt('HIDETHEGOLDINTHETREESTUMP') == 'BMODZBXDNABEKUDMUIXMMOUVIF'
+	# J shares a cell with I
+	assert playfair.Playfair.from_keyword('JAZZ').grid[0][:3] == ['I', 'A', 'Z']
+
+
+def test_j_folds_into_i():
+	cipher = playfair.Playfair.from_keyword('MONARCHY')
+	assert cipher.encrypt('jump') == cipher.encrypt('iump')
+	# and a J next to an I is a double
+	assert cipher.encrypt('IJ') == cipher.encrypt('II')
+	assert cipher.decrypt(cipher.encrypt('jump')) == 'iump'
+
+
+def test_letters_outside_grid():
+	with pytest.raises(ValueError, match='not in the grid'):
+		playfair.Playfair.from_keyword('MONARCHY').encrypt('hello world')
+
+
+def test_solve_odd_length(english, tmp_path):
+	path = tmp_path / 'english.txt'
+	path.write_text(english)
+	with pytest.raises(SystemExit):
+		playfair.main(['-s', str(path), 'ABC'])
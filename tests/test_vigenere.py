@@ -0,0 +1,108 @@
+import random
+import pytest
+import vigenere
+import string
+from string import ascii_letters, ascii_uppercase
+from crypto import normalize, CustomAlphabet, OFFSET_UPPER, OFFSET_LOWER
+
+
+def random_text(rng, length, letters=ascii_letters):
+	return ''.join(rng.choice(letters) for _ in range(length))
+
+
+@pytest.mark.parametrize('key_length', [1, 5, vigenere.STRIDE_LIMIT, vigenere.STRIDE_LIMIT + 1, 5000])
+@pytest.mark.parametrize('sign, offset', [(+1, OFFSET_UPPER), (-1, OFFSET_LOWER)])
+def test_bulk_matches_reference(key_length, sign, offset):
+	rng = random.Random(key_length)
+	message = random_text(rng, 3000)
+	key = random_text(rng, key_length)
+	expected = vigenere.vigenere(message, key, sign, offset)
+	assert vigenere.vigenere_bulk(message, key, sign, offset) == expected
+
+
+@pytest.mark.parametrize('key', ['LEMON', 'QZX', 'CRYPTOGRAPHY', 'ABSOLUTELYRANDOMKEY'])
+def test_crack(english, key):
+	ciphertext = vigenere.encrypt(normalize(english), key)
+	assert vigenere.crack(ciphertext) == key
+
+
+def test_crack_short_text(english):
+	ciphertext = vigenere.encrypt(normalize(english)[:1500], 'CRYPTOGRAPHY')
+	assert vigenere.crack(ciphertext) == 'CRYPTOGRAPHY'
+
+
+@pytest.mark.parametrize('length', [8, 2000, 50000])
+def test_crack_random_text(length):
+	# no length looks like plaintext, but the best one is still tried
+	rng = random.Random(length)
+	ciphertext = ''.join(rng.choice(ascii_uppercase) for _ in range(length))
+	key = vigenere.crack(ciphertext)
+	assert key.isalpha()
+	assert len(vigenere.decrypt(ciphertext, key)) == length
+
+
+def test_shortest_key():
+	assert vigenere.shortest_key('ABCABCABC') == 'ABC'
+	assert vigenere.shortest_key('ABCABD') == 'ABCABD'
+
+
+def test_pad_round_trip(tmp_path):
+	path = tmp_path / 'pad'
+	path.write_bytes(b'QWERTY UIOP\nASDFGHJKL ZXCVBNM')
+	with vigenere.PadStore(str(path)) as pad:
+		ciphertext = ''.join(vigenere.encrypt_pad(['hello', 'world'], pad))
+		assert (pad.start, pad.offset) == (0, 11)
+		pad.commit()
+		with pytest.raises(ValueError):
+			pad.seek(0)
+			''.join(vigenere.encrypt_pad(['again'], pad))
+	with vigenere.PadStore(str(path)) as pad:
+		# later messages start after the used range, but the recipient may go back
+		assert pad.offset == 11
+		pad.seek(0)
+		assert ''.join(vigenere.decrypt_pad([ciphertext], pad)) == 'helloworld'
+
+
+def test_offset_needs_pad():
+	with pytest.raises(SystemExit):
+		vigenere.main(['-k', 'KEY', '--offset', '3', 'hello'])
+
+
+def test_bad_pad(tmp_path):
+	path = tmp_path / 'pad'
+	path.write_bytes(b'QWERTY')
+	with pytest.raises(SystemExit):
+		vigenere.main(['-p', str(path), '--offset', '99', 'hello'])
+	path.write_bytes(b'')
+	with pytest.raises(ValueError):
+		vigenere.PadStore(str(path))
+	with pytest.raises(SystemExit):
+		vigenere.main(['-p', str(path), 'hello'])
+
+
+def split(rng, text, count=10):
+	bounds = sorted(rng.sample(range(1, len(text)), count))
+	return [text[i:j] for i, j in zip([0] + bounds, bounds + [len(text)])]
+
+
+@pytest.mark.parametrize('key_length', [1, 7, 100])
+def test_stream_matches_whole(key_length):
+	rng = random.Random(key_length)
+	message = random_text(rng, 2000)
+	key = random_text(rng, key_length)
+	chunks = split(rng, message)
+	assert ''.join(vigenere.encrypt_stream(chunks, key)) == vigenere.encrypt(message, key)
+	assert ''.join(vigenere.decrypt_stream(chunks, key)) == vigenere.decrypt(message, key)
+
+
+@pytest.mark.parametrize('letters', ['ABCDEFGHIJKLMNOPQRSTUVWXYZÀÉ .,', string.ascii_uppercase + string.digits + string.punctuation])
+def test_custom_alphabet(letters):
+	alphabet = CustomAlphabet(letters)
+	rng = random.Random(len(letters))
+	message = random_text(rng, 2000, alphabet.letters)
+	key = random_text(rng, 7, alphabet.letters)
+	expected = ''.join(vigenere.vigenere(message, key, +1, OFFSET_UPPER, alphabet))
+	assert vigenere.encrypt(message, key, alphabet) == expected
+	assert vigenere.decrypt(expected, key, alphabet) == ''.join(vigenere.vigenere(expected, key, -1, OFFSET_LOWER, alphabet))
+	with pytest.raises(ValueError):
+		vigenere.encrypt(message + '\x00', key, alphabet)
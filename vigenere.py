@@ -1,22 +1,271 @@
+import os
+import mmap
 import itertools
-from crypto import acode, join_result, normalize, OFFSET_UPPER, OFFSET_LOWER
+import instrument
+from collections import Counter
+from functools import lru_cache
+from string import ascii_letters
+from crypto import join_result, normalize, ALPHABET, OFFSET_UPPER, OFFSET_LOWER, ENGLISH_FREQUENCIES
+
+
+# keys up to this length are applied one stride at a time; longer keys (pads)
+# are added to the message all at once
+STRIDE_LIMIT = 64
+# the largest alphabet whose code sums still fit in a byte
+SUM_LIMIT = 128
+PAD_INDEX_SUFFIX = '.used'
+NON_LETTERS = bytes(range(256)).translate(None, ascii_letters.encode('ascii'))
+
+
+def results(alphabet, offset):
+	return alphabet.lower if offset == OFFSET_LOWER else alphabet.upper
 
 
 @join_result
-def vigenere(message, key, sign, offset):
-	key = [sign * acode(k) for k in key]
+def vigenere(message, key, sign, offset, alphabet=ALPHABET):
+	result = results(alphabet, offset)
+	key = [sign * alphabet.encode(k) for k in key]
 	for m, k in zip(message, itertools.cycle(key)):
-		yield chr((acode(m) + k) % 26 + offset)
+		yield chr(result[(alphabet.encode(m) + k) % alphabet.size])
 
 
-def encrypt(message, key):
-	return vigenere(message, key, +1, OFFSET_UPPER)
+@lru_cache(maxsize=64)
+def shift_tables(alphabet, sign, offset):
+	lower = offset == OFFSET_LOWER
+	return [alphabet.table(lambda a: a + sign * k, lower) for k in range(alphabet.size)]
 
-def decrypt(message, key):
-	return vigenere(message, key, -1, OFFSET_LOWER)
 
+@lru_cache(maxsize=64)
+def key_codes(alphabet, sign):
+	return bytes(sign * a % alphabet.size for a in alphabet.codes)
 
-if __name__ == '__main__':
+
+@instrument.measured('vigenere.vigenere_bulk', len)
+def vigenere_bulk(message, key, sign, offset, alphabet=ALPHABET):
+	try:
+		data = message.encode('latin-1')
+		key_data = key.encode('latin-1')
+	except UnicodeEncodeError:
+		return vigenere(message, key, sign, offset, alphabet)
+	if not key_data:
+		return ''
+	alphabet.check(data)
+	alphabet.check(key_data)
+
+	if len(key_data) <= STRIDE_LIMIT:
+		tables = shift_tables(alphabet, sign, offset)
+		result = bytearray(len(data))
+		step = len(key_data)
+		for i, k in enumerate(key_data.translate(alphabet.codes)):
+			result[i::step] = data[i::step].translate(tables[k % alphabet.size])
+		return result.decode('latin-1')
+	if alphabet.size > SUM_LIMIT:
+		return vigenere(message, key, sign, offset, alphabet)
+
+	# every code is below 32 (or the size of a custom alphabet), so adding the
+	# message and key stream as big integers never carries from one byte into the next
+	key_data = key_data.translate(key_codes(alphabet, sign))
+	key_data = (key_data * -(-len(data) // len(key_data)))[:len(data)]
+	total = int.from_bytes(data.translate(alphabet.codes), 'big') + int.from_bytes(key_data, 'big')
+	return total.to_bytes(len(data), 'big').translate(results(alphabet, offset)).decode('latin-1')
+
+
+def vigenere_stream(chunks, key, sign, offset, alphabet=ALPHABET):
+	if not key:
+		return
+	phase = 0
+	for chunk in chunks:
+		end = phase + len(chunk)
+		if end <= len(key):
+			window = key[phase:end]
+		else:
+			window = key[phase:] + key[:phase]
+		yield vigenere_bulk(chunk, window, sign, offset, alphabet)
+		phase = end % len(key)
+
+
+def encrypt(message, key, alphabet=ALPHABET):
+	return vigenere_bulk(message, key, +1, OFFSET_UPPER, alphabet)
+
+def decrypt(message, key, alphabet=ALPHABET):
+	return vigenere_bulk(message, key, -1, OFFSET_LOWER, alphabet)
+
+def encrypt_stream(chunks, key, alphabet=ALPHABET):
+	return vigenere_stream(chunks, key, +1, OFFSET_UPPER, alphabet)
+
+def decrypt_stream(chunks, key, alphabet=ALPHABET):
+	return vigenere_stream(chunks, key, -1, OFFSET_LOWER, alphabet)
+
+
+class PadStore:
+	# a one-time pad file, mapped rather than read, with the byte ranges already
+	# used kept in a sidecar index so that no letter of it is used twice
+
+	def __init__(self, path):
+		self.index_path = path + PAD_INDEX_SUFFIX
+		with open(path, 'rb') as f:
+			if os.fstat(f.fileno()).st_size == 0:
+				raise ValueError(f"the pad {path} is empty")
+			self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		self.used = []
+		try:
+			with open(self.index_path) as f:
+				self.used = [tuple(map(int, line.split())) for line in f if line.strip()]
+		except FileNotFoundError:
+			pass
+		self.seek(max((end for _, end in self.used), default=0))
+
+	def __len__(self):
+		return len(self._map)
+
+	def seek(self, offset):
+		if not 0 <= offset <= len(self):
+			raise ValueError(f"offset {offset} is outside the pad")
+		self.start = self.offset = offset
+
+	def overlaps(self, start, end):
+		return any(start < used_end and used_start < end for used_start, used_end in self.used)
+
+	def take(self, count, reuse=False):
+		# the next count letters of the pad; only the bytes they span are copied
+		key = b''
+		offset = self.offset
+		while len(key) < count:
+			if offset >= len(self._map):
+				raise ValueError("the pad is used up")
+			end = min(offset + count - len(key), len(self._map))
+			if not reuse and self.overlaps(offset, end):
+				raise ValueError(f"pad bytes {offset}-{end} have been used before")
+			key += self._map[offset:end].translate(None, NON_LETTERS)
+			offset = end
+		self.offset = offset
+		return key.decode('ascii')
+
+	def commit(self):
+		# records the range taken since the last seek or commit
+		if self.offset > self.start:
+			with open(self.index_path, 'a') as f:
+				f.write(f"{self.start} {self.offset}\n")
+			self.used.append((self.start, self.offset))
+		self.start = self.offset
+
+	def close(self):
+		self._map.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+def vigenere_pad(chunks, pad, sign, offset, reuse=False):
+	for chunk in chunks:
+		yield vigenere_bulk(chunk, pad.take(len(chunk), reuse), sign, offset)
+
+
+def encrypt_pad(chunks, pad):
+	return vigenere_pad(chunks, pad, +1, OFFSET_UPPER)
+
+def decrypt_pad(chunks, pad):
+	# the recipient follows the sender through the same pad, but may decrypt a message again
+	return vigenere_pad(chunks, pad, -1, OFFSET_LOWER, reuse=True)
+
+
+DEFAULT_MAX_LENGTH = 400
+# key length detection only needs a sample of a long ciphertext
+SAMPLE_SIZE = 1 << 20
+KASISKI_SAMPLE = 1 << 16
+# halfway between the coincidence rate of random letters and of English
+IOC_THRESHOLD = (1 / 26 + sum(f * f for f in ENGLISH_FREQUENCIES)) / 2
+
+
+def letter_codes(text):
+	return normalize(text).encode('ascii', 'ignore').translate(ALPHABET.codes)
+
+
+def coincidence(codes, shift):
+	# the fraction of letters equal to the letter shift places later, found by
+	# xoring the two alignments as big integers and counting zero bytes
+	length = len(codes) - shift
+	diff = int.from_bytes(codes[shift:], 'big') ^ int.from_bytes(codes[:length], 'big')
+	return diff.to_bytes(length, 'big').count(0) / length
+
+
+def column_coincidence(codes, length):
+	same = 0
+	pairs = 0
+	for i in range(length):
+		column = codes[i::length]
+		same += sum(n * (n - 1) for n in map(column.count, range(26)))
+		pairs += len(column) * (len(column) - 1)
+	return same / pairs if pairs else 0
+
+
+def kasiski(codes, lengths, size=3):
+	# for each candidate length, how many distances between repeated sequences it divides
+	last_seen = {}
+	distances = Counter()
+	for i in range(len(codes) - size + 1):
+		seq = codes[i:i + size]
+		if seq in last_seen:
+			distances[i - last_seen[seq]] += 1
+		last_seen[seq] = i
+	return {length: sum(n for d, n in distances.items() if d % length == 0) for length in lengths}
+
+
+def key_lengths(codes, max_length=DEFAULT_MAX_LENGTH):
+	# lengths whose columns look like plaintext, best first
+	codes = codes[:SAMPLE_SIZE]
+	max_length = min(max_length, len(codes) // 2)
+	if max_length < 1:
+		return [1]
+	kappa = [None] + [coincidence(codes, length) for length in range(1, max_length + 1)]
+	# every multiple of the key length is a column alignment too, so averaging over them smooths out noise
+	score = {length: sum(kappa[length::length]) / (max_length // length) for length in range(1, max_length + 1)}
+	candidates = [length for length, k in score.items() if min(k, kappa[length]) >= IOC_THRESHOLD]
+	if not candidates:
+		candidates = [max(score, key=score.get)]
+	# a length that shares some columns with the key can pass on sampled pairs, but its
+	# mixed columns show up once every pair in each column is counted
+	ioc = {length: column_coincidence(codes, length) for length in candidates}
+	# capped so that the best length stays even when none clears the threshold
+	cutoff = min((max(ioc.values()) + IOC_THRESHOLD) / 2, max(ioc.values()))
+	candidates = [length for length in candidates if ioc[length] >= cutoff]
+	# multiples of the key length coincide just as often, but divide fewer repeat distances
+	support = kasiski(codes[:KASISKI_SAMPLE], candidates)
+	return sorted(candidates, key=lambda length: (-support[length], length))
+
+
+def solve_column(column):
+	counts = [column.count(a) for a in range(26)]
+	total = len(column) or 1
+	expected = [f * total for f in ENGLISH_FREQUENCIES]
+
+	def chi_squared(shift):
+		return sum((counts[(a + shift) % 26] - e) ** 2 / e for a, e in enumerate(expected))
+
+	return min(range(26), key=chi_squared)
+
+
+def solve_key(codes, length):
+	return ''.join(chr(solve_column(codes[i::length]) + OFFSET_UPPER) for i in range(length))
+
+
+def shortest_key(key):
+	# a key that repeats itself encrypts the same as one copy of it
+	for length in range(1, len(key)):
+		if len(key) % length == 0 and key[:length] * (len(key) // length) == key:
+			return key[:length]
+	return key
+
+
+def crack(ciphertext, max_length=DEFAULT_MAX_LENGTH):
+	codes = letter_codes(ciphertext)
+	return shortest_key(solve_key(codes, key_lengths(codes, max_length)[0]))
+
+
+def main(argv=None):
 	import argparse
 	import cryptoargs
 	
@@ -25,15 +274,58 @@ if __name__ == '__main__':
 	cryptoargs.add_input(parser)
 	key_group = parser.add_mutually_exclusive_group(required=True)
 	key_group.add_argument('-k', '--key', type=str, help='the cipher key')
-	key_group.add_argument('-p', '--pad', type=str, metavar='FILE', help='a file containing the cipher key (ideal for one-time pads)')
+	key_group.add_argument('-p', '--pad', type=str, metavar='FILE', help='a one-time pad file; each message takes the next unused letters, recorded in FILE.used')
+	key_group.add_argument('-s', '--solve', type=int, nargs='?', const=DEFAULT_MAX_LENGTH, metavar='MAX_LENGTH',
+		help=f'recover an unknown key of up to MAX_LENGTH (default {DEFAULT_MAX_LENGTH}) letters, report it and decrypt')
+	parser.add_argument('--offset', type=int, help='the byte offset in the pad to start at, instead of the first unused one')
 	cryptoargs.add_mode(parser)
 	cryptoargs.add_output(parser)
-	args = parser.parse_args()
+	args = parser.parse_args(argv)
+	if args.offset is not None and args.pad is None:
+		parser.error('argument --offset: only allowed with -p/--pad')
+
+	if args.solve is not None:
+		import sys
+		message = normalize(cryptoargs.get_input(args))
+		key = crack(message, args.solve)
+		print(f"key: {key}", file=sys.stderr)
+		cryptoargs.write_result(args, decrypt(message, key))
+		sys.exit()
+
+	chunks = map(normalize, cryptoargs.read_chunks(args))
+	if args.pad is not None:
+		import sys
+		try:
+			pad = PadStore(args.pad)
+		except ValueError as e:
+			sys.exit(e)
+		with pad:
+			if args.offset is not None:
+				if not 0 <= args.offset <= len(pad):
+					parser.error(f'argument --offset: must be between 0 and the pad length {len(pad)}')
+				pad.seek(args.offset)
+			mode = cryptoargs.get_mode(args, encrypt_pad, decrypt_pad)
+			if mode is None:
+				plaintext, chunks = cryptoargs.probe_chunks(chunks)
+				mode = encrypt_pad if plaintext else decrypt_pad
+			try:
+				cryptoargs.write_chunks(args, mode(chunks, pad))
+			except ValueError as e:
+				sys.exit(e)
+			finally:
+				# even a failed message may have printed text under these pad letters
+				print(f"pad: {pad.start}-{pad.offset}", file=sys.stderr)
+				pad.commit()
+		sys.exit()
 
-	message = normalize(cryptoargs.get_input(args))
-	key = normalize(cryptoargs.str_or_file(args, 'key', 'pad'))
-	mode = cryptoargs.get_mode(args, encrypt, decrypt)
+	key = normalize(args.key)
+	mode = cryptoargs.get_mode(args, encrypt_stream, decrypt_stream)
 	if mode is None:
-		mode = encrypt if message[0].islower() else decrypt
+		plaintext, chunks = cryptoargs.probe_chunks(chunks)
+		mode = encrypt_stream if plaintext else decrypt_stream
 
-	cryptoargs.write_result(args, mode(message, key))
+	cryptoargs.write_chunks(args, mode(chunks, key))
+
+
+if __name__ == '__main__':
+	main()